@@ -1,10 +1,15 @@
 # Importing the necessary classes and libraries
-from helper_functions.classes import User, StudentUser, RegularUser, AdminUser, Inventory, Sandwich, Order, Loyalty
-from helper_functions.update_dfs import update_customers_df, update_orders_df
+from helper_functions.classes import User, StudentUser, RegularUser, AdminUser, Inventory, Sandwich, Order, Loyalty, StockLevels, Shop, CustomerRegistry
+from helper_functions.update_dfs import update_customers_df, update_orders_df, load_dataframes, analytics_snapshot, DATA_FILES
+from helper_functions.search import CustomerSearchIndex
+from helper_functions.event_log import EventLog
+from helper_functions.combos import CoOccurrenceMatrix, describe_configuration
 import streamlit as st
+import csv
+import threading
 from datetime import datetime
-import pandas as pd
-import plotly.express as px
+from itertools import count
+# pandas, Plotly and pyarrow are imported lazily by the Analytics section so the Customer View starts fast
 
 hide_decoration_bar_style = '''
     <style>
@@ -13,36 +18,145 @@ hide_decoration_bar_style = '''
 '''
 st.markdown(hide_decoration_bar_style, unsafe_allow_html=True) # Hiding the Streamlit header
 
-# Global variables to hold data
-customers = {}
-orders = []
-
-# Initialize session state for inventory, customers, orders, etc.
-if "inventory" not in st.session_state:
-    st.session_state.inventory = Inventory()  # Store the inventory
-if "customers" not in st.session_state:
-    st.session_state.customers = {}  # Store all customers
-if "orders" not in st.session_state:
-    st.session_state.orders = []  # Store all orders
+# Shop locations: each has its own inventory, stock and kitchen board; customers are shared
+SHOPS = {
+    "main": "Main Shop",
+    "campus": "Campus Shop",
+}
+
+@st.cache_resource
+def get_event_log():
+    return EventLog() # One journal shared by every session
+
+
+event_log = get_event_log()
+
+
+RESERVATION_TIMEOUT = 30 * 60 # Release reservations of orders abandoned for 30 minutes
+
+
+@st.cache_resource
+def get_stock_levels(shop_id):
+    return StockLevels(reservation_timeout=RESERVATION_TIMEOUT) # Stock counters shared by every till of the shop
+
+
+@st.cache_resource
+def recover_state():
+    # Rebuild customers, orders, the shops' inventories and stock from the last snapshot plus the event log tail.
+    # Runs once per process: every session works on the same objects instead of replaying the log again
+    customers, orders, inventories, stock_levels = event_log.recover()
+    shops = {}
+    for shop_id in set(SHOPS) | set(inventories) | {o.shop_id for o in orders}:
+        inventory = inventories.get(shop_id) or Inventory()
+        inventory.stock = get_stock_levels(shop_id) # Every till of the shop reserves from the same stock
+        inventory.stock.seed(stock_levels.get(shop_id, {}))
+        shops[shop_id] = Shop(shop_id, SHOPS.get(shop_id, shop_id), inventory)
+    for order in orders:
+        shops[order.shop_id].add_order(order) # Partition the orders by shop
+    return customers, orders, shops
+
+
+# The shops with their inventories and orders, all customers and all orders, shared by every session
+customers, orders, shops = recover_state()
+
+
+@st.cache_resource
+def get_customer_index(_customers):
+    # Search index over every customer, shared by every session. Indexing the preloaded customers takes
+    # seconds for a large dataset, so it happens in a background thread instead of on the first page render
+    index = CustomerSearchIndex()
+    loaded = threading.Event() # Set once the preloaded and recovered customers are indexed
+
+    def load():
+        try:
+            index.load_csv(DATA_FILES["customers_df"]) # The preloaded customers
+            for recovered_customer in list(_customers.values()):
+                index.add_customer(recovered_customer, existing_ok=True) # And those recovered from the event log
+        finally:
+            loaded.set() # Never leave a session waiting, even if loading failed
+
+    threading.Thread(target=load, name="customer-index", daemon=True).start()
+    return index, loaded
+
+
+customer_index, customer_index_loaded = get_customer_index(customers)
+
+
+@st.cache_resource
+def get_customer_registry():
+    # Every customer account; customers from the dataset get theirs when they first log in
+    return CustomerRegistry(customers, customer_index, event_log, customer_index_loaded)
+
+
+def wait_for_customer_index():
+    if not customer_index_loaded.is_set():
+        with st.spinner("Loading customers..."):
+            customer_index_loaded.wait() # Only right after the server started
+
+# Initialize session state for the current order and customer
 if "current_order" not in st.session_state:
     st.session_state.current_order = None  # Store the current order being created
 if "logged_in_customer" not in st.session_state:
     st.session_state.logged_in_customer = None  # Track the currently logged-in customer
 
-# Load the datasets into session state
-if "ingredients_df" not in st.session_state:
-    st.session_state.ingredients_df = pd.read_csv("simulated_data/ingredients.csv")
+# The datasets (customers_df, orders_df, ingredients_df) are loaded once per process, on first use, by load_dataframes()
+
+
+@st.cache_resource
+def get_combo_stats():
+    return CoOccurrenceMatrix() # Ingredient co-occurrence and popular configurations, shared by every session
+
+
+get_combo_stats().seed(orders) # Add the recovered order history once per process
+
+
+@st.cache_resource
+def get_sketch_store():
+    from helper_functions.sketches import SketchStore
+    return SketchStore() # Approximate analytics sketches shared by every session
+
+
+@st.cache_resource
+def seed_sketch_store(_orders):
+    get_sketch_store().load_csv("simulated_data/orders.csv") # Add the historical orders once per process
+    # And the journaled ones; orders placed since the process started were recorded as they were placed
+    first_live_id = first_live_order_id(_orders)
+    get_sketch_store().record_orders([order for order in list(_orders) if order.order_id < first_live_id])
+    return True
+
+
+@st.cache_resource
+def get_analytics_pool():
+    from helper_functions.analytics import create_analytics_pool # Imported on first use of the Analytics section
+    return create_analytics_pool() # One process pool shared by every session
+
+
+@st.cache_resource
+def get_analytics_worker():
+    from helper_functions.analytics import AnalyticsWorker # Pulls in pandas and Plotly
+    return AnalyticsWorker(get_analytics_pool()) # Publishes the analytics of every session's orders
+
 
-if "customers_df" not in st.session_state:
-    st.session_state.customers_df = pd.read_csv("simulated_data/customers.csv")
+@st.cache_resource
+def first_live_order_id(_orders):
+    # First order ID handed out by this process: after the historical and the journaled orders
+    with open(DATA_FILES["orders_df"], newline="", encoding="utf-8") as f:
+        last_historical = max((int(row["Order ID"]) for row in csv.DictReader(f)), default=0)
+    last_journaled = max((order.order_id for order in _orders), default=0)
+    return max(last_historical, last_journaled) + 1
 
-if "orders_df" not in st.session_state:
-    st.session_state.orders_df = pd.read_csv("simulated_data/orders.csv")
+
+@st.cache_resource
+def get_order_ids(_orders):
+    # One order ID sequence for every session, so IDs never repeat across sessions or collide with the orders in the dataset
+    return count(first_live_order_id(_orders)) # next() on a count is atomic in CPython
 
 
 # Navigation sidebar for Customer and Admin views
 st.sidebar.title("Navigation")
 view = st.sidebar.radio("Select a View:", ["Customer View", "Admin View"])
+shop_id = st.sidebar.selectbox("Shop:", list(SHOPS), format_func=SHOPS.get) # Shop this till or board belongs to
+shop = shops[shop_id] # Reference the selected shop
 
 # Customer View
 if view == "Customer View":
@@ -63,17 +177,20 @@ if view == "Customer View":
             if submitted:
                 if not customer_id or not name or not email or not phone:
                     st.error("All fields are required to create an account.") # Error message if any field is empty
-                elif customer_id in st.session_state.customers:
-                    st.error("Customer ID already exists. Please use a different ID.")
                 else:
                     # Check for student email and create the appropriate customer type
                     if email.endswith("@student.cbs.dk"):
                         customer = StudentUser(customer_id, name, email, phone) # Creating a student user
                     else:
                         customer = RegularUser(customer_id, name, email, phone) # Creating a regular user
-                    st.session_state.customers[customer_id] = customer # Add the customer to the session state
-                    update_customers_df() # Update the customers dataframe
-                    st.success("Account created successfully!")
+                    wait_for_customer_index() # IDs of the preloaded customers are taken too
+                    try:
+                        get_customer_registry().create(customer) # Add, index and journal the account
+                    except ValueError:
+                        st.error("Customer ID already exists. Please use a different ID.")
+                    else:
+                        update_customers_df(customers) # Update the customers dataframe
+                        st.success("Account created successfully!")
 
         # Log in
         st.subheader("Log In") 
@@ -82,8 +199,14 @@ if view == "Customer View":
             login_submit = st.form_submit_button("Log In") # Submit button for the form
 
             if login_submit:
-                if login_id in st.session_state.customers:
-                    st.session_state.logged_in_customer = st.session_state.customers[login_id] # Log in the customer if ID is found
+                new_account = login_id not in customers # A preloaded customer logging in for the first time
+                if new_account:
+                    wait_for_customer_index()
+                login_customer = get_customer_registry().get(login_id)
+                if login_customer is not None:
+                    if new_account:
+                        update_customers_df(customers) # Update the customers dataframe
+                    st.session_state.logged_in_customer = login_customer # Log in the customer if ID is found
                     st.success(f"Welcome back, {st.session_state.logged_in_customer.name}!")
                     st.rerun() # Rerun the app to show the logged-in view
                 else:
@@ -95,17 +218,23 @@ if view == "Customer View":
         st.subheader(f"Welcome, {customer.name}! 🥪") 
         st.write("**Your Sandwich, Your Way** – Crafted just for you!")
 
+        # An order belongs to one shop; switching shops starts a new order there
+        if st.session_state.current_order is not None and st.session_state.current_order.shop_id != shop_id:
+            st.session_state.current_order.release_stock() # Give back the ingredients reserved at the other shop
+            st.session_state.current_order = None
+
         # Initialize a new order for the customer if not already started
         if st.session_state.current_order is None: # If no order is in progress
             st.session_state.current_order = Order(
-                order_id=len(st.session_state.orders) + 1,
+                order_id=next(get_order_ids(orders)), # Unique across sessions
                 customer=customer,
-                inventory=st.session_state.inventory
+                inventory=shop.inventory,
+                shop_id=shop_id
             )
 
         # Reference the current order from session state
         order = st.session_state.current_order
-        inventory = st.session_state.inventory
+        inventory = shop.inventory
         
         # Place an order
         st.subheader("Place an Order")
@@ -116,6 +245,28 @@ if view == "Customer View":
                 "2. **Add the Sandwich** – Add it to your order list.\n"
                 "3. **Place Your Order** – Submit your order when ready or add more sandwiches."
             )
+        # One-tap popular combos, served from the cached co-occurrence statistics
+        popular_combos = get_combo_stats().popular_configurations(3)
+        if popular_combos:
+            st.markdown("**⭐ Popular Combos**")
+            combo_columns = st.columns(len(popular_combos))
+            for combo_index, (configuration, _) in enumerate(popular_combos):
+                with combo_columns[combo_index]:
+                    if st.button(describe_configuration(configuration) or "Plain sandwich", key=f"combo_{combo_index}"):
+                        bread, spread, protein, vegetables, dressing, extras = configuration
+                        sandwich = Sandwich(inventory=inventory) # Create a new sandwich object
+                        try:
+                            sandwich.select_bread(bread)
+                            sandwich.select_spread(spread)
+                            sandwich.select_protein(protein)
+                            sandwich.add_vegetables(list(vegetables))
+                            sandwich.select_dressing(dressing)
+                            sandwich.add_extras(list(extras))
+                            order.add_sandwich(sandwich)
+                            st.success("Sandwich added to order!")
+                        except ValueError as e:
+                            st.error(str(e)) # An ingredient is no longer available or out of stock
+
         # Two columns layout
         col8, col9 = st.columns([7, 3])
 
@@ -154,11 +305,25 @@ if view == "Customer View":
                 if not order.sandwiches:
                     st.error("No sandwiches in the order! Add at least one sandwich before placing the order.")
                 else:
+                    try:
+                        sold = order.commit_stock() # The reserved ingredients are now sold
+                    except ValueError as e:
+                        # A reservation expired and its ingredients were sold to someone else; the order cannot be made
+                        order.release_stock()
+                        st.session_state.current_order = None
+                        st.error(f"{e} Your order was cleared, please add your sandwiches again.")
+                        st.stop()
                     total, discount_message = order.calculate_total() # Calculate the total cost of the order
+                    with shop.lock: # Journaled in the order the shop's tills place them
+                        event_log.order_placed(order, sold) # Journal the order and the stock it used before other sessions can see it
+                        shop.add_order(order) # Add the order to the shop's kitchen board
+                        orders.append(order) # Add the order to the global orders list
+                    get_sketch_store().record_order(customer.user_id, order.order_time, total, order.sandwiches, shop_id) # Update the analytics sketches
                     customer.add_order(order) # Add the order to the customer's order history
-                    st.session_state.orders.append(order) # Add the order to the global orders list
-                    update_customers_df() # Update the customers dataframe
-                    update_orders_df() # Update the orders dataframe
+                    get_combo_stats().add_orders([order]) # Update the ingredient co-occurrence statistics
+                    event_log.maybe_snapshot() # Compacts the log in the background every few thousand events
+                    update_customers_df(customers) # Update the customers dataframe
+                    update_orders_df(orders, shop_id) # Update the orders dataframe
                     st.session_state.current_order = None # Reset the current order
                     st.success(f"Order placed successfully! Total cost: {total:.2f} DKK") 
                     if discount_message:
@@ -175,6 +340,9 @@ if view == "Customer View":
 
             # Log out
             if st.button("Log Out"):
+                if st.session_state.current_order is not None:
+                    st.session_state.current_order.release_stock() # Give back the ingredients of the unplaced order
+                    st.session_state.current_order = None
                 st.session_state.logged_in_customer = None
                 st.success("Logged out successfully!")
                 st.rerun()
@@ -206,20 +374,23 @@ if view == "Admin View":
         st.info(
             """
         **Admin Dashboard Overview:**
-        Use the tabs below to access key functionalities:
+        Use the sections below to access key functionalities:
 
         - **Manage Orders**: Track and update the status of orders.
         - **Analytics**: View sales, top customers, ingredient trends, and order volume.
         - **Manage Inventory**: Add, update, or remove ingredients to keep stock optimized.
+        - **Customers**: Search customers by name, email or phone.
             """
         )
 
-        # Create tabs, including the new "Manage Orders" tab
-        tab1, tab2, tab3 = st.tabs(["Manage Orders", "Analytics", "Manage Inventory"])
+        # Section selector; unlike st.tabs only the selected section runs, so analytics load only when opened
+        admin_tab = st.radio(
+            "Section", ["Manage Orders", "Analytics", "Manage Inventory", "Customers"], horizontal=True, label_visibility="collapsed"
+        )
 
         # Tab 1: Manage Orders
-        with tab1:
-            st.header("Manage Orders")
+        if admin_tab == "Manage Orders":
+            st.header(f"Manage Orders – {shop.name}")
 
             # Define the statuses and how they flow
             status_flow = {
@@ -230,14 +401,21 @@ if view == "Admin View":
             }
             
 
-            # Fetch all orders from session state
-            all_orders = st.session_state.orders
-
-            # Separate orders by status
-            pending_orders = [o for o in all_orders if o.status == "Pending"] # Orders with status "Pending"
-            in_progress_orders = [o for o in all_orders if o.status == "In Progress"] # Orders with status "In Progress"
-            ready_orders = [o for o in all_orders if o.status == "Ready for Pickup"] # Orders with status "Ready for Pickup"
-            done_orders = [o for o in all_orders if o.status == "Done"] # Orders with status "Done"
+            def move_order(order, next_status):
+                # Another admin may have moved the order since the board was shown; only the first move counts
+                with shop.lock:
+                    if status_flow[order.status] != next_status:
+                        return
+                    order.update_status(next_status) # Update the status of the order
+                    event_log.order_status_updated(order) # Journal the status change while no other session can move it
+                update_orders_df(orders, shop_id) # Update the orders dataframe
+
+            # Separate this shop's orders by status; other shops' orders are never scanned
+            board = shop.orders_by_status(status_flow)
+            pending_orders = board["Pending"] # Orders with status "Pending"
+            in_progress_orders = board["In Progress"] # Orders with status "In Progress"
+            ready_orders = board["Ready for Pickup"] # Orders with status "Ready for Pickup"
+            done_orders = board["Done"] # Orders with status "Done"
 
             col_pending, col_in_progress, col_ready, col_done = st.columns(4) # Create 4 columns layout
             with col_pending:
@@ -248,8 +426,7 @@ if view == "Admin View":
                         st.write(str(order))
                         next_status = status_flow[order.status] # Get the next status for the order
                         if next_status and st.button(f"Move to '{next_status}'", key=f"pending_{order.order_id}"):
-                            order.update_status(next_status) # Update the status of the order
-                            update_orders_df() # Update the orders dataframe
+                            move_order(order, next_status) # Update and journal the status of the order
                             st.rerun() # Rerun the app to show the updated order status
 
             with col_in_progress:
@@ -260,8 +437,7 @@ if view == "Admin View":
                         st.write(str(order))
                         next_status = status_flow[order.status] # Get the next status for the order
                         if next_status and st.button(f"Move to '{next_status}'", key=f"inprogress_{order.order_id}"):
-                            order.update_status(next_status) # Update the status of the order
-                            update_orders_df() # Update the orders dataframe
+                            move_order(order, next_status) # Update and journal the status of the order
                             st.rerun() # Rerun the app to show the updated order status
 
             with col_ready:
@@ -272,8 +448,7 @@ if view == "Admin View":
                         st.write(str(order))
                         next_status = status_flow[order.status] # Get the next status for the order
                         if next_status and st.button(f"Move to '{next_status}'", key=f"ready_{order.order_id}"):
-                            order.update_status(next_status) # Update the status of the order
-                            update_orders_df() # Update the orders dataframe
+                            move_order(order, next_status) # Update and journal the status of the order
                             st.rerun() # Rerun the app to show the updated order status
 
             with col_done:
@@ -285,119 +460,239 @@ if view == "Admin View":
                         # No next status for done orders
 
         # Tab 2: Analytics
-        with tab2:
+        if admin_tab == "Analytics":
             st.header("Analytics")
-
-            # Access the updated dataframes from session state
-            customers_df = st.session_state.customers_df 
-            orders_df = st.session_state.orders_df
-            ingredients_df = st.session_state.get("ingredients_df", pd.DataFrame())
-
-            # Metrics
-            total_revenue = orders_df["Total Cost (DKK)"].sum() if not orders_df.empty else 0 # Total revenue
-            total_customers = customers_df["Customer ID"].nunique() if not customers_df.empty else 0 # Total customers
-            total_orders = orders_df["Order ID"].nunique() if not orders_df.empty else 0 # Total orders
-
-            col1, col2, col3 = st.columns(3) # Create 3 columns layout
-            with col1:
-                st.metric("Total Revenue (DKK)", f"{total_revenue:,.2f}") # Display total revenue
-            with col2:
-                st.metric("Total Customers", total_customers) # Display total customers
-            with col3:
-                st.metric("Total Orders", total_orders) # Display total orders
-
-            # Revenue over time
-            st.subheader("Revenue Over Time")
-            if not orders_df.empty:
-                revenue_by_date = (
-                    orders_df.groupby(orders_df["Order Time"].str[:10])["Total Cost (DKK)"] # Group by date
-                    .sum() # Sum the total cost
-                    .reset_index() # Reset the index
-                ) # Calculate the revenue by date
-                revenue_by_date.columns = ["Date", "Revenue"] # Rename the columns
-                revenue_by_date["Date"] = pd.to_datetime(revenue_by_date["Date"]) # Convert the date to datetime
-
-                fig_revenue = px.line(revenue_by_date, x="Date", y="Revenue", title="Revenue Over Time") # Create a line plot for revenue over time 
-                st.plotly_chart(fig_revenue, use_container_width=True) # Display the line plot
-            else:
-                st.info("No revenue data available.")
-
-            # Row for "Top Customers" and "Ingredient Popularity"
-            st.markdown("---")
-            st.subheader("Top Insights")
-            col4, col5 = st.columns(2) # Create 2 columns layout
-
-            with col4:
-                st.subheader("Top Customers")
-                if not customers_df.empty:
-                    top_customers = (
-                        customers_df[["Name", "Total Sandwiches Purchased"]] # Select columns
-                        .sort_values(by="Total Sandwiches Purchased", ascending=False) # Sort by total sandwiches purchased
-                        .head(10) # Select top 10 customers
-                    )
-                    st.table(top_customers) # Display the top customers
+            approximate = st.toggle("Approximate mode (sketches)", help="Estimates from mergeable sketches, with error bounds. Scales to years of multi-shop history.")
+            if approximate:
+                seed_sketch_store(orders) # Historical and journaled orders are added to the sketches once per process
+                sketch_shop = st.selectbox("Shops", ["All shops"] + list(SHOPS), format_func=lambda s: SHOPS.get(s, s), key="sketch_shop")
+                sketch_shops = None if sketch_shop == "All shops" else {sketch_shop}
+                sketch_months = get_sketch_store().months(sketch_shops)
+                period_start, period_end = None, None # All months
+                if len(sketch_months) > 1:
+                    period_start, period_end = st.select_slider(
+                        "Period", sketch_months, value=(sketch_months[0], sketch_months[-1]), key="sketch_period"
+                    ) # Range of months to merge
+                sketches = get_sketch_store().merged(period_start, period_end, sketch_shops) # Per-month sketches of the selected shops and period, cached until the next order
+                customers_error = sketches.customers.relative_error() * 2 # Two standard deviations (~95%)
+
+                col1, col2, col3 = st.columns(3) # Create 3 columns layout
+                with col1:
+                    st.metric("Distinct Customers (approx.)", f"{sketches.customers.count():,.0f}") # HyperLogLog estimate
+                    st.caption(f"± {customers_error:.1%} (95% confidence)")
+                with col2:
+                    st.metric("Total Orders", f"{sketches.orders:,}") # Exact counter
+                    st.caption("Exact")
+                with col3:
+                    median_value = sketches.order_values.quantile(0.5)
+                    st.metric("Median Order Value (DKK)", f"{median_value:,.2f}" if median_value is not None else "–") # t-digest estimate
+                    low, high = sketches.order_values.quantile_bounds(0.5)
+                    if low is not None:
+                        st.caption(f"Between {low:,.2f} and {high:,.2f} DKK")
+
+                # Order value distribution
+                st.subheader("Order Value Distribution")
+                if sketches.order_values.count:
+                    quantile_rows = []
+                    for q in (0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+                        low, high = sketches.order_values.quantile_bounds(q)
+                        quantile_rows.append({
+                            "Percentile": f"p{round(q * 100)}",
+                            "Order Value (DKK)": round(sketches.order_values.quantile(q), 2),
+                            "Error Bound (DKK)": f"{low:,.2f} – {high:,.2f}",
+                        })
+                    st.table(quantile_rows) # Display the estimated percentiles
                 else:
-                    st.info("No customer data available.")
+                    st.info("No order data available.")
 
-            with col5:
-                st.subheader("Ingredient Popularity")
-                if not ingredients_df.empty and "Usage" in ingredients_df.columns:
-                    top_ingredients = ingredients_df.sort_values(by="Usage", ascending=False).head(10) # Select top 10 ingredients
-                    st.table(top_ingredients)
+                # Row for "Ingredient Popularity" and "Popular Configurations"
+                st.markdown("---")
+                col4, col5 = st.columns(2) # Create 2 columns layout
+                with col4:
+                    st.subheader("Ingredient Popularity")
+                    top_ingredients = sketches.ingredients.top(10) # Count-Min heavy hitters
+                    if top_ingredients:
+                        st.table([{"Ingredient": name, "Usage (approx.)": count} for name, count in top_ingredients])
+                        st.caption(f"Counts may be overestimated by up to {sketches.ingredients.error_bound():,.0f} (99% confidence)")
+                    else:
+                        st.info("No ingredient usage recorded since sketches were enabled.")
+                with col5:
+                    st.subheader("Popular Configurations")
+                    top_configurations = sketches.configurations.top(10)
+                    if top_configurations:
+                        st.table([{"Sandwich": name, "Sold (approx.)": count} for name, count in top_configurations])
+                        st.caption(f"Counts may be overestimated by up to {sketches.configurations.error_bound():,.0f} (99% confidence)")
+                    else:
+                        st.info("No sandwich configurations recorded since sketches were enabled.")
+            else:
+                load_dataframes(customers, orders) # Read the datasets the first time analytics are opened
+                analytics_worker = get_analytics_worker()
+
+                # Ask the background worker to recompute analytics if the data changed since the last run;
+                # only shops whose orders changed are recomputed
+                analytics_worker.refresh(*analytics_snapshot())
+
+                # Results are computed by the background worker; the tab only reads the latest published version
+                analytics = analytics_worker.latest()
+                analytics_error = analytics_worker.error()
+                if analytics_error:
+                    st.error(f"Analytics could not be computed: {analytics_error}")
+                    st.button("Retry", key="retry_analytics") # Rerunning requests the failed version again
+                if analytics is None:
+                    if not analytics_error:
+                        st.info("Analytics are being computed in the background. Press **Refresh** in a moment.")
+                        st.button("Refresh", key="refresh_analytics") # Rerun the script to pick up the result
                 else:
-                    st.info("No ingredient usage data available.")
-
-            # Row for "Order Volume by Date" and "Customers by Total Orders"
-            st.markdown("---")
-            col6, col7 = st.columns(2) # Create 2 columns layout
-
-            with col6:
-                st.subheader("Order Volume by Date")
-                if not orders_df.empty:
-                    orders_by_date = (
-                        orders_df.groupby(orders_df["Order Time"].str[:10])["Order ID"] # Group by date
-                        .count() # Count the number of orders
-                        .reset_index() # Reset the index
+                    if analytics_error:
+                        st.caption(f"Showing the last results, from {analytics.computed_at:%H:%M:%S}.")
+                    elif analytics_worker.is_stale():
+                        st.caption(f"Showing results from {analytics.computed_at:%H:%M:%S}; newer data is being processed.")
+                        st.button("Refresh", key="refresh_analytics")
+
+                    # Per-shop results are precomputed; "All shops" merges the per-shop partial aggregates
+                    analytics_shop = st.selectbox(
+                        "Shops", ["All shops"] + sorted(analytics.shop_values), format_func=lambda s: SHOPS.get(s, s), key="analytics_shop"
                     )
-                    orders_by_date.columns = ["Date", "Order Count"] # Rename the columns
-                    orders_by_date["Date"] = pd.to_datetime(orders_by_date["Date"]) # Convert the date to datetime
+                    analytics = analytics.for_shop(None if analytics_shop == "All shops" else analytics_shop)
+
+                    # Metrics
+                    col1, col2, col3 = st.columns(3) # Create 3 columns layout
+                    with col1:
+                        st.metric("Total Revenue (DKK)", f"{analytics['total_revenue']:,.2f}") # Display total revenue
+                    with col2:
+                        st.metric("Total Customers", analytics["total_customers"]) # Display total customers
+                    with col3:
+                        st.metric("Total Orders", analytics["total_orders"]) # Display total orders
+
+                    # Revenue over time
+                    st.subheader("Revenue Over Time")
+                    if analytics["fig_revenue"] is not None:
+                        st.plotly_chart(analytics["fig_revenue"], use_container_width=True) # Display the line plot
+                    else:
+                        st.info("No revenue data available.")
+
+                    # Row for "Top Customers" and "Ingredient Popularity"
+                    st.markdown("---")
+                    st.subheader("Top Insights")
+                    col4, col5 = st.columns(2) # Create 2 columns layout
+
+                    with col4:
+                        st.subheader("Top Customers")
+                        if analytics["top_customers"] is not None:
+                            st.table(analytics["top_customers"]) # Display the top customers
+                        else:
+                            st.info("No customer data available.")
+
+                    with col5:
+                        st.subheader("Ingredient Popularity")
+                        if analytics_shop != "All shops":
+                            st.caption("All shops: ingredient usage is not recorded per shop.")
+                        if analytics["top_ingredients"] is not None:
+                            st.table(analytics["top_ingredients"])
+                        else:
+                            st.info("No ingredient usage data available.")
+
+                    # Row for "Order Volume by Date" and "Customers by Total Orders"
+                    st.markdown("---")
+                    col6, col7 = st.columns(2) # Create 2 columns layout
+
+                    with col6:
+                        st.subheader("Order Volume by Date")
+                        if analytics["fig_orders"] is not None:
+                            st.plotly_chart(analytics["fig_orders"], use_container_width=True) # Display the bar plot
+                        else:
+                            st.info("No order data available.")
+
+                    with col7:
+                        st.subheader("Customers by Total Orders")
+                        if analytics["fig_customers"] is not None:
+                            st.plotly_chart(analytics["fig_customers"], use_container_width=True) # Display the bar plot
+                        else:
+                            st.info("No customer data available.")
+
+            # Ingredient combos from the incrementally updated co-occurrence matrix
+            st.markdown("---")
+            st.subheader("Ingredient Combos")
+            combo_stats = get_combo_stats()
+            known_ingredients = combo_stats.known_ingredients()
+            if known_ingredients:
+                col_partners, col_configurations = st.columns(2) # Create 2 columns layout
+                with col_partners:
+                    combo_category, combo_ingredient = st.selectbox(
+                        "Ingredient", sorted(known_ingredients), format_func=lambda key: f"{key[1]} ({key[0]})"
+                    ) # Selectbox to choose an ingredient
+                    partners = combo_stats.top_partners(combo_category, combo_ingredient, k=5)
+                    if partners:
+                        st.table([
+                            {"Goes With": partner, "Sandwiches": count, "Share": f"{share:.0%}"}
+                            for partner, count, share in partners
+                        ]) # Most frequent partners of the selected ingredient
+                    else:
+                        st.info("No combinations recorded for this ingredient yet.")
+                with col_configurations:
+                    st.markdown("**Popular Configurations**")
+                    st.table([
+                        {"Sandwich": describe_configuration(configuration) or "Plain sandwich", "Sold (approx.)": count}
+                        for configuration, count in combo_stats.popular_configurations(10)
+                    ])
+            else:
+                st.info("No sandwiches recorded yet.")
 
-                    fig_orders = px.bar(orders_by_date, x="Date", y="Order Count", title="Order Volume by Date") # Create a bar plot for order volume by date
-                    st.plotly_chart(fig_orders, use_container_width=True) # Display the bar plot
-                else: 
-                    st.info("No order data available.")
+            # Export orders and sandwich lines for offline analysis
+            st.markdown("---")
+            st.subheader("Export Data")
+            if st.button("Export to Parquet"):
+                from helper_functions.export import export_to_parquet # pyarrow is only needed for exports
+                datasets = load_dataframes(customers, orders) # The approximate mode does not load the datasets
+                journaled_orders = list(orders) # Every session's orders, with their change sequence numbers
+                exported = export_to_parquet(datasets["orders_df"], journaled_orders) # Only new and changed orders are written
+                st.success(f"Exported {exported['orders']} orders and {exported['sandwich_lines']} sandwich lines to Parquet.")
 
-            with col7:
-                st.subheader("Customers by Total Orders")
-                if not customers_df.empty:
-                    customer_orders = customers_df[["Name", "Number of Orders"]].sort_values(
-                        by="Number of Orders", ascending=False
-                    ).head(10) # Select top 10 customers by total orders
+        # Tab 3: Manage Inventory
+        if admin_tab == "Manage Inventory":
+            st.header(f"Manage Inventory – {shop.name}")
 
-                    fig_customers = px.bar(customer_orders, x="Name", y="Number of Orders", title="Top Customers by Total Orders") # Create a bar plot for top customers by total orders
-                    st.plotly_chart(fig_customers, use_container_width=True) # Display the bar plot
-                else:
-                    st.info("No customer data available.")
+            LOW_STOCK_THRESHOLD = 5 # Warn when an ingredient has this many units or fewer left
 
-        # Tab 3: Manage Inventory
-        with tab3:
-            st.header("Manage Inventory")
+            shop.inventory.stock.release_expired(RESERVATION_TIMEOUT) # Tills also do this when they reserve; the levels below should be current too
+            for low_category, low_ingredient, low_available in shop.inventory.low_stock(LOW_STOCK_THRESHOLD):
+                st.warning(f"Low stock: **{low_ingredient}** ({low_category}) has {low_available} units left.")
 
             categories = ["Bread", "Spread", "Protein", "Vegetable", "Extra", "Dressing"] # List of categories
             selected_category = st.selectbox("Choose Category", categories) # Selectbox to choose a category
 
             if selected_category:
                 category_key = selected_category.lower() # Convert the category to lowercase
-                inventory = st.session_state.inventory # Reference the inventory
+                inventory = shop.inventory # Reference the selected shop's inventory
                 category_dict = inventory._get_category_dict(category_key) # Get the category dictionary
 
                 if category_dict:
                     st.write(f"### Current Ingredients in {selected_category}:") # Display the current ingredients in the selected category
                     for ingredient, price in category_dict.items():
-                        st.write(f"- **{ingredient}:** {price:.2f} DKK") # Display the ingredient and its price
+                        stock = inventory.get_stock(category_key, ingredient) # None if stock is not tracked
+                        stock_text = f" · {stock} in stock" if stock is not None else ""
+                        st.write(f"- **{ingredient}:** {price:.2f} DKK{stock_text}") # Display the ingredient, its price and stock
                 else:
                     st.error(f"Invalid category '{selected_category}'.")
 
+                # Update Stock
+                st.markdown("### Update Stock")
+                if category_dict:
+                    with st.form("Update Stock", clear_on_submit=True):
+                        stock_ingredient = st.selectbox("Ingredient", list(category_dict.keys())) # Selectbox to choose an ingredient
+                        stock_quantity = st.number_input("Units in Stock", min_value=0, value=0, step=1) # Number input for the stock level
+                        update_stock_btn = st.form_submit_button("Update Stock") # Submit button to set the stock level
+
+                        if update_stock_btn:
+                            try:
+                                with shop.lock: # Journaled in the order the shop's admins make the changes
+                                    inventory.set_stock(category_key, stock_ingredient, int(stock_quantity)) # Set the stock level
+                                    event_log.stock_set(category_key, stock_ingredient, int(stock_quantity), shop_id) # Journal the change
+                                st.success(f"**{stock_ingredient}** now has {int(stock_quantity)} units in stock.")
+                                st.rerun() # Rerun the app to show the updated stock
+                            except ValueError as e:
+                                st.error(str(e)) # Display error message if the stock level is invalid
+
                 # Add New Ingredient
                 st.markdown("### Add New Ingredient")
                 with st.form("Add Ingredient", clear_on_submit=True): 
@@ -408,7 +703,9 @@ if view == "Admin View":
 
                     if add_ingredient_btn:
                         try:
-                            inventory.add_ingredient(add_category, new_ingredient, new_price) # Add the new ingredient
+                            with shop.lock:
+                                inventory.add_ingredient(add_category, new_ingredient, new_price) # Add the new ingredient
+                                event_log.ingredient_added(add_category, new_ingredient, new_price, shop_id) # Journal the change
                             st.success(f"Added **{new_ingredient}** to **{add_category.capitalize()}** category.")
                             st.rerun() # Rerun the app to show the updated inventory
                         except ValueError as e:
@@ -420,8 +717,41 @@ if view == "Admin View":
                     ingredient_to_remove = st.selectbox("Choose Ingredient to Remove", list(category_dict.keys())) # Selectbox to choose an ingredient to remove
                     if st.button("Remove Ingredient"):
                         try:
-                            inventory.remove_ingredient(category_key, ingredient_to_remove) # Remove the ingredient
+                            with shop.lock:
+                                inventory.remove_ingredient(category_key, ingredient_to_remove) # Remove the ingredient
+                                event_log.ingredient_removed(category_key, ingredient_to_remove, shop_id) # Journal the change
                             st.success(f"Removed **{ingredient_to_remove}** from **{selected_category.capitalize()}**.") 
                             st.rerun() # Rerun the app to show the updated inventory
                         except ValueError as e:
-                            st.error(str(e)) # Display error message if ingredient does not exist
\ No newline at end of file
+                            st.error(str(e)) # Display error message if ingredient does not exist
+
+        # Tab 4: Customer Directory
+        if admin_tab == "Customers":
+            st.header("Customers")
+
+            search_query = st.text_input("Search by name, email or phone") # Partial matches are allowed
+            if st.session_state.get("directory_query") != search_query:
+                st.session_state.directory_query = search_query
+                st.session_state.directory_page = 1 # Start from the first page for a new search
+
+            wait_for_customer_index()
+            admin = AdminUser("admin", "Admin", "admin@hiko.dk", "") # The logged-in admin
+            rows, has_more = admin.search_customers(
+                customer_index, search_query, page=st.session_state.directory_page
+            ) # One page of matching customers
+            if rows:
+                st.table(rows) # Display the current page
+            else:
+                st.info("No customers found.")
+
+            col_prev, col_page, col_next = st.columns([1, 2, 1]) # Pagination controls
+            with col_prev:
+                if st.button("Previous", disabled=st.session_state.directory_page == 1):
+                    st.session_state.directory_page -= 1
+                    st.rerun()
+            with col_page:
+                st.write(f"Page {st.session_state.directory_page} · {len(customer_index)} customers in total")
+            with col_next:
+                if st.button("Next", disabled=not has_more):
+                    st.session_state.directory_page += 1
+                    st.rerun()
@@ -0,0 +1,71 @@
+# Cold-start benchmark: import time of the domain classes and time to first render of the Customer View.
+# Every measurement runs in a fresh interpreter so nothing is cached between them.
+# Run from the repository root: python -m benchmarks.startup
+import json
+import subprocess
+import sys
+
+# Budgets in seconds; the benchmark fails if a median exceeds its budget
+BUDGETS = {
+    "classes_import": 0.05, # import helper_functions.classes
+    "first_render": 0.5, # First run of app.py (Customer View), excluding the import of streamlit itself
+}
+RUNS = 5 # Measurements per budget; the median is compared against the budget
+
+CLASSES_IMPORT = """
+import json, sys, time
+start = time.perf_counter()
+import helper_functions.classes
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "heavy": [m for m in ("pandas", "streamlit", "plotly") if m in sys.modules]}))
+"""
+
+FIRST_RENDER = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+preloaded = set(sys.modules) # Modules streamlit itself already imported
+at = AppTest.from_file("app.py", default_timeout=60)
+start = time.perf_counter()
+at.run()
+elapsed = time.perf_counter() - start
+loaded = set(sys.modules) - preloaded
+print(json.dumps({
+    "seconds": elapsed,
+    "error": [str(e.value) for e in at.exception],
+    "heavy": sorted(m for m in ("pandas", "plotly.express", "pyarrow") if m in loaded),
+}))
+"""
+
+
+def measure(code):
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    failures = []
+    for name, code in [("classes_import", CLASSES_IMPORT), ("first_render", FIRST_RENDER)]:
+        results = [measure(code) for _ in range(RUNS)]
+        seconds = median(r["seconds"] for r in results)
+        heavy = results[-1]["heavy"]
+        print(f"{name}: {seconds * 1000:.1f} ms (budget {BUDGETS[name] * 1000:.0f} ms), heavy modules loaded: {heavy or 'none'}")
+        if seconds > BUDGETS[name]:
+            failures.append(f"{name} is over budget")
+        if heavy:
+            failures.append(f"{name} imported {', '.join(heavy)}")
+        if results[-1].get("error"):
+            failures.append(f"{name} raised {results[-1]['error']}")
+
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: within the cold-start budget")
+
+
+if __name__ == "__main__":
+    main()
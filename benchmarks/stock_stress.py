@@ -0,0 +1,164 @@
+# Stress check for stock reservations: many tills compete for the last units of an ingredient.
+# Run from the repository root: python -m benchmarks.stock_stress
+import random
+import threading
+import time
+
+from helper_functions.classes import Inventory, RegularUser, Sandwich, Order, StockLevels
+
+TILLS = 32 # Concurrent sessions
+ATTEMPTS = 200 # Sandwiches each till tries to sell
+UNITS = 1_000 # Avocado in stock, far fewer than TILLS * ATTEMPTS
+
+
+def avocado_order(order_id, customer, inventory):
+    order = Order(order_id, customer, inventory=inventory)
+    sandwich = Sandwich(inventory=inventory)
+    sandwich.select_bread("White")
+    sandwich.add_extras(["Avocado", "Cheddar cheese"])
+    order.add_sandwich(sandwich) # Raises ValueError when out of stock
+    return order
+
+
+def till(till_id, stock, sold, barrier):
+    inventory = Inventory(stock=stock) # Every session has its own inventory but shares the stock
+    customer = RegularUser(f"T{till_id}", f"Till {till_id}", f"till{till_id}@example.com", "0")
+    barrier.wait() # Start all tills at the same time
+    for attempt in range(ATTEMPTS):
+        try:
+            order = avocado_order(attempt, customer, inventory)
+        except ValueError:
+            continue # Out of stock
+        if random.random() < 0.2:
+            order.release_stock() # Customer walked away
+            continue
+        try:
+            order.commit_stock()
+        except ValueError:
+            continue # The reservation expired and the stock was sold to another till
+        sold[till_id] += 1
+
+
+def expire(stock, done):
+    while not done.is_set():
+        stock.release_expired(0) # Expire every open reservation, as if each till had been idle too long
+        time.sleep(0.001)
+
+
+def expired_reservation():
+    """
+    One avocado left: the first order's reservation expires, a second order reserves the avocado,
+    and then both try to place their order. Only one of them may be sold.
+    """
+    stock = StockLevels()
+    inventory = Inventory(stock=stock)
+    inventory.set_stock("extra", "Avocado", 1)
+    customer = RegularUser("C1", "Customer", "customer@example.com", "0")
+
+    first = avocado_order(1, customer, inventory)
+    assert stock.release_expired(0) == 1, "Reservation did not expire"
+    second = avocado_order(2, customer, inventory)
+    second.commit_stock()
+    try:
+        first.commit_stock()
+    except ValueError:
+        pass # Expected: the avocado was sold to the second order
+    else:
+        raise AssertionError("Oversold: an expired reservation was committed without stock")
+    assert inventory.get_stock("extra", "Avocado") == 0, "Stock does not add up"
+
+    inventory.set_stock("extra", "Avocado", 1) # Restocked: an expired reservation is taken from the stock again
+    third = avocado_order(3, customer, inventory)
+    stock.release_expired(0)
+    assert third.commit_stock() == {("extra", "Avocado"): 1}, "Expired reservation was not sold after restocking"
+    assert inventory.get_stock("extra", "Avocado") == 0, "Stock does not add up after restocking"
+    print("OK: expired reservations are not oversold")
+
+
+def abandoned_reservation():
+    """
+    One avocado left and the order holding it is abandoned: once its reservation times out, the next
+    till's reservation releases it and gets the avocado, without anyone opening Manage Inventory.
+    """
+    stock = StockLevels(reservation_timeout=0.05)
+    inventory = Inventory(stock=stock)
+    inventory.set_stock("extra", "Avocado", 1)
+    customer = RegularUser("C1", "Customer", "customer@example.com", "0")
+
+    avocado_order(1, customer, inventory) # Abandoned: never placed or released
+    try:
+        avocado_order(2, customer, inventory)
+    except ValueError:
+        pass # Expected: the reservation has not timed out yet
+    else:
+        raise AssertionError("Oversold: the avocado was reserved twice")
+    time.sleep(StockLevels.EXPIRY_CHECK_INTERVAL + 0.1)
+    second = avocado_order(3, customer, inventory) # Releases the expired reservation first
+    assert second.commit_stock() == {("extra", "Avocado"): 1}, "Abandoned reservation still blocks the stock"
+    assert stock.low_stock(0) == [("extra", "Avocado", 0)], "Low stock does not add up"
+    print("OK: abandoned reservations are released by the next reservation")
+
+
+def untrack_while_listing():
+    """
+    Ingredients removed while the low-stock list is built are skipped instead of failing.
+    """
+    stock = StockLevels()
+    keys = [("extra", f"Item {i}") for i in range(200)]
+    done = threading.Event()
+
+    def churn():
+        while not done.is_set():
+            for key in keys:
+                stock.set_stock(key, 1)
+            for key in keys:
+                stock.untrack(key)
+
+    churner = threading.Thread(target=churn)
+    churner.start()
+    try:
+        for _ in range(2_000):
+            stock.low_stock(5) # Raised TypeError when an ingredient was untracked mid-scan
+    finally:
+        done.set()
+        churner.join()
+    print("OK: low stock tolerates concurrent untracking")
+
+
+def main():
+    expired_reservation()
+    abandoned_reservation()
+    untrack_while_listing()
+
+    stock = StockLevels()
+    setup = Inventory(stock=stock)
+    setup.set_stock("extra", "Avocado", UNITS)
+    setup.set_stock("extra", "Cheddar cheese", UNITS * 10)
+    setup.set_stock("bread", "White", UNITS * 10)
+
+    sold = [0] * TILLS
+    barrier = threading.Barrier(TILLS)
+    done = threading.Event()
+    expirer = threading.Thread(target=expire, args=(stock, done))
+    threads = [threading.Thread(target=till, args=(i, stock, sold, barrier)) for i in range(TILLS)]
+    start = time.perf_counter()
+    expirer.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    expirer.join()
+    elapsed = time.perf_counter() - start
+
+    remaining = setup.get_stock("extra", "Avocado")
+    print(f"{TILLS} tills, {TILLS * ATTEMPTS} attempts in {elapsed:.2f}s, reservations expiring concurrently")
+    print(f"Avocado sold: {sum(sold)}, remaining: {remaining}")
+    assert sum(sold) + remaining == UNITS, "Stock does not add up"
+    assert remaining >= 0, "Oversold"
+    assert setup.get_stock("bread", "White") == UNITS * 10 - sum(sold), "Bread does not add up"
+    print("OK: no overselling")
+
+
+if __name__ == "__main__":
+    main()
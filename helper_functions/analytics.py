@@ -0,0 +1,271 @@
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import plotly.express as px
+
+# Background analytics: aggregates are computed in a process pool and published as versioned results
+
+logger = logging.getLogger(__name__)
+
+def aggregate_orders(orders_part):
+    """
+    Compute the partial aggregates for one date partition of orders_df: revenue and order count per date,
+    and orders and sandwiches per customer. Runs inside a worker process.
+    """
+    dates = orders_part["Order Time"].str[:10] # Date part of the order time
+    by_date = orders_part.groupby(dates).agg(
+        Revenue=("Total Cost (DKK)", "sum"),
+        Order_Count=("Order ID", "count"),
+    )
+    by_customer = orders_part.groupby("Customer ID").agg(
+        Number_of_Orders=("Order ID", "count"),
+        Sandwiches=("Number of Sandwiches", "sum"),
+    )
+    return by_date, by_customer
+
+
+def _sum_partials(partials, columns):
+    partials = [p for p in partials if not p.empty]
+    if not partials:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(partials).groupby(level=0).sum()
+
+
+def merge_aggregates(partials):
+    """
+    Merge partial (per-date, per-customer) aggregates. Partitions may share a boundary date and
+    customers order on many dates, so the rows are summed again.
+    """
+    return (
+        _sum_partials([by_date for by_date, _ in partials], ["Revenue", "Order_Count"]),
+        _sum_partials([by_customer for _, by_customer in partials], ["Number_of_Orders", "Sandwiches"]),
+    )
+
+
+def shop_customers(by_customer, customers_df):
+    """
+    Turn per-customer aggregates of one shop's orders into rows shaped like customers_df, named from customers_df.
+    """
+    names = customers_df.drop_duplicates("Customer ID", keep="last").set_index("Customer ID")["Name"] if not customers_df.empty else {}
+    customer_ids = by_customer.index.to_series()
+    return pd.DataFrame({
+        "Customer ID": customer_ids.values,
+        "Name": customer_ids.map(names).fillna(customer_ids).values, # Unknown customers show their ID
+        "Total Sandwiches Purchased": by_customer["Sandwiches"].values,
+        "Number of Orders": by_customer["Number_of_Orders"].values,
+    })
+
+
+def build_results(aggregates, customers_df, ingredients_df, by_shop=False):
+    """
+    Build the metrics, tables and Plotly figures shown on the Analytics tab from the merged aggregates.
+    For one shop (`by_shop`) the customer metrics come from that shop's orders; for all shops they come
+    from customers_df, which also counts registered customers without orders.
+    Ingredient usage is only recorded for all shops combined.
+    Runs inside a worker process so figure construction never happens in the Streamlit script thread.
+    """
+    by_date, by_customer = aggregates
+    if by_shop:
+        customers_df = shop_customers(by_customer, customers_df) # Only the customers who ordered in this shop
+    results = {
+        "total_revenue": by_date["Revenue"].sum() if not by_date.empty else 0, # Total revenue
+        "total_customers": customers_df["Customer ID"].nunique() if not customers_df.empty else 0, # Total customers
+        "total_orders": int(by_date["Order_Count"].sum()) if not by_date.empty else 0, # Order IDs are unique in orders_df
+        "fig_revenue": None,
+        "fig_orders": None,
+        "top_customers": None,
+        "top_ingredients": None,
+        "fig_customers": None,
+    }
+
+    if not by_date.empty:
+        by_date = by_date.reset_index() # Dates back into a column
+        by_date.columns = ["Date", "Revenue", "Order Count"] # Rename the columns
+        by_date["Date"] = pd.to_datetime(by_date["Date"]) # Convert the date to datetime
+        results["fig_revenue"] = px.line(by_date, x="Date", y="Revenue", title="Revenue Over Time") # Line plot for revenue over time
+        results["fig_orders"] = px.bar(by_date, x="Date", y="Order Count", title="Order Volume by Date") # Bar plot for order volume by date
+
+    if not customers_df.empty:
+        results["top_customers"] = (
+            customers_df[["Name", "Total Sandwiches Purchased"]] # Select columns
+            .sort_values(by="Total Sandwiches Purchased", ascending=False) # Sort by total sandwiches purchased
+            .head(10) # Select top 10 customers
+        )
+        customer_orders = customers_df[["Name", "Number of Orders"]].sort_values(
+            by="Number of Orders", ascending=False
+        ).head(10) # Select top 10 customers by total orders
+        results["fig_customers"] = px.bar(customer_orders, x="Name", y="Number of Orders", title="Top Customers by Total Orders")
+
+    if not ingredients_df.empty and "Usage" in ingredients_df.columns:
+        results["top_ingredients"] = ingredients_df.sort_values(by="Usage", ascending=False).head(10) # Select top 10 ingredients
+
+    return results
+
+
+def partition_by_date(orders_df, n_partitions):
+    """
+    Split orders_df into at most `n_partitions` contiguous date ranges of roughly equal size.
+    """
+    if orders_df.empty:
+        return []
+    ordered = orders_df.sort_values("Order Time") # "YYYY-MM-DD HH:MM:SS" strings sort chronologically
+    size = -(-len(ordered) // n_partitions) # Ceiling division
+    return [ordered.iloc[start:start + size] for start in range(0, len(ordered), size)]
+
+
+class AnalyticsResult:
+    """
+    An immutable, versioned snapshot of the Analytics tab contents, for all shops and for each shop.
+    """
+    def __init__(self, version, values, shop_values=None):
+        self.version = version # Data version the result was computed from
+        self.computed_at = datetime.now() # When the result was published
+        self.values = values # Metrics, tables and figures from build_results, all shops combined
+        self.shop_values = shop_values or {} # shop_id -> the same, for one shop
+
+    def for_shop(self, shop_id=None):
+        """
+        Return the values for one shop, or for all shops combined if shop_id is None.
+        """
+        return self.values if shop_id is None else self.shop_values[shop_id]
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+
+class AnalyticsWorker:
+    """
+    Recomputes analytics in a shared process pool whenever the data version changes and publishes the
+    latest result. The Analytics tab only reads `latest()`, so it never blocks on the computation.
+    Requests that arrive while a computation is running are coalesced into a single follow-up run.
+    Order aggregates are kept per shop and only recomputed for shops whose orders changed; the
+    all-shops view merges the per-shop partial aggregates.
+    """
+    def __init__(self, pool, n_partitions=None):
+        self.pool = pool # Shared ProcessPoolExecutor
+        self.n_partitions = n_partitions or os.cpu_count() or 1 # One date partition per core by default
+        self._lock = threading.Lock()
+        self._result = None # Latest published AnalyticsResult
+        self._pending = None # Newest snapshot waiting to be computed
+        self._running_version = None # Version currently being computed
+        self._requested_version = None # Newest version requested so far
+        self._error = None # (version, message) of the last failed computation
+        self._shop_partials = {} # shop_id -> (shop version, per-date aggregates)
+
+    def refresh(self, version, orders_df, customers_df, ingredients_df, shop_versions=None):
+        """
+        Request a recomputation for the given data version. Returns immediately.
+        `shop_versions` maps shop_id to a counter that changes whenever that shop's orders change
+        ("*" for changes affecting every shop); without it every shop is recomputed.
+        """
+        with self._lock:
+            failed = self._error is not None and self._error[0] == version
+            if version == self._requested_version and not failed:
+                return # Already published, running or queued
+            self._requested_version = version
+            self._error = None # A failed version is retried on the next refresh
+            self._pending = (version, orders_df, customers_df, ingredients_df, dict(shop_versions) if shop_versions else None)
+            if self._running_version is not None:
+                return # The running thread picks up the pending snapshot when it finishes
+            self._running_version = version
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def latest(self):
+        """
+        Return the most recently published AnalyticsResult, or None if nothing has been computed yet.
+        """
+        return self._result
+
+    def is_stale(self):
+        """
+        True if a newer data version has been requested than the one currently published.
+        """
+        result = self._result
+        return result is None or result.version != self._requested_version
+
+    def error(self):
+        """
+        Return why the newest requested version could not be computed, or None if it did not fail.
+        """
+        error = self._error
+        return error[1] if error is not None and error[0] == self._requested_version else None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._pending is None:
+                    self._running_version = None # Nothing left to compute
+                    return
+                version, orders_df, customers_df, ingredients_df, shop_versions = self._pending
+                self._pending = None
+                self._running_version = version
+            try:
+                values, shop_values = self._compute(orders_df, customers_df, ingredients_df, shop_versions)
+            except Exception as e:
+                logger.exception("Computing analytics for data version %s failed", version)
+                with self._lock:
+                    self._error = (version, f"{type(e).__name__}: {e}")
+                continue # Keep serving the previous result, which stays marked as stale
+            self._result = AnalyticsResult(version, values, shop_values) # Publish; runs are sequential so results arrive in order
+
+    def _compute(self, orders_df, customers_df, ingredients_df, shop_versions):
+        shop_orders = dict(tuple(orders_df.groupby("Shop ID"))) if "Shop ID" in orders_df.columns else {"main": orders_df}
+        futures = {}
+        partials = {}
+        for shop_id, orders_part in shop_orders.items():
+            key = (shop_versions.get("*", 0), shop_versions.get(shop_id, 0)) if shop_versions is not None else None
+            cached = self._shop_partials.get(shop_id)
+            if key is not None and cached and cached[0] == key:
+                partials[shop_id] = cached # This shop's orders did not change
+                continue
+            futures[shop_id] = (key, [
+                self.pool.submit(aggregate_orders, part)
+                for part in partition_by_date(orders_part, self.n_partitions)
+            ]) # Aggregate each date partition of the shop on its own core
+        for shop_id, (key, shop_futures) in futures.items():
+            partials[shop_id] = (key, merge_aggregates([f.result() for f in shop_futures]))
+        self._shop_partials = partials
+
+        merged = merge_aggregates([aggregates for _, aggregates in partials.values()]) # All shops: merge the partials
+        builds = {shop_id: self.pool.submit(build_results, aggregates, customers_df, ingredients_df, True)
+                  for shop_id, (_, aggregates) in partials.items()} # Customer metrics from each shop's own orders
+        values = self.pool.submit(build_results, merged, customers_df, ingredients_df).result()
+        return values, {shop_id: future.result() for shop_id, future in builds.items()}
+
+
+class AnalyticsPool(ProcessPoolExecutor):
+    """
+    A process pool whose workers do not re-run the main script when they start.
+    Under `streamlit run` the app script is installed as __main__, and processes started by a fork server
+    import their parent's __main__ from its file before running a task, which would execute the whole app
+    (event log, recovery, customer index) in every worker. The workers only need this module, so __main__
+    is swapped for an empty module while submit() may start one.
+    """
+    _start_lock = threading.Lock() # The swap is process-wide
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._start_lock:
+            main = sys.modules["__main__"]
+            sys.modules["__main__"] = types.ModuleType("__main__") # No __file__: workers skip importing the script
+            try:
+                return super().submit(fn, *args, **kwargs) # Starts a worker process if none is idle
+            finally:
+                sys.modules["__main__"] = main
+
+
+def create_analytics_pool(max_workers=None):
+    """
+    Create the process pool used by every AnalyticsWorker.
+    Workers are started by a fork server rather than forked from the Streamlit server: forking a process
+    that runs other threads (script runners, the event log flusher) can leave a child holding a lock forever.
+    """
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__]) # pandas and Plotly are imported once, by the fork server
+    return AnalyticsPool(max_workers=max_workers, mp_context=context)
@@ -11,6 +11,7 @@ class User:
         self.name = name # User's full name
         self.email = email # User's email address
         self.phone = phone # User's phone number
+        self.search_index = None # CustomerSearchIndex this user is registered in, if any
 
     def update_contact_info(self, email=None, phone=None):
         """
@@ -20,6 +21,8 @@ class User:
             self.email = email # Update email if provided
         if phone:
             self.phone = phone # Update phone number if provided
+        if self.search_index is not None and (email or phone):
+            self.search_index.update(self.user_id, self.name, self.email, self.phone) # Keep the search index in sync
 
     def apply_discount(self, total_cost):
         """
@@ -94,6 +97,13 @@ class AdminUser(User):
         """
         return customers or [] # Return the list of customers or an empty list if no customers exist
 
+    def search_customers(self, search_index, query="", page=1, page_size=20):
+        """
+        Search customers by partial name, email or phone and return one page of results
+        together with a flag telling whether there is a next page.
+        """
+        return search_index.page(query, page, page_size)
+
     def manage_inventory(self, inventory, action, category, item_name, price=None):
         """
         Manage the inventory by adding or removing items (admin-only feature).
@@ -108,13 +118,264 @@ class AdminUser(User):
     def __str__(self):
         return super().__str__() + "\nRole: Admin" # Include role in the string representation
 
+#### Customer Registry
+import threading
+
+class CustomerRegistry:
+    """
+    Every customer account, shared by all sessions and journaled in the event log.
+    Customers from the historical dataset are only in the search index until they first log in;
+    their account is then created from the indexed record, so their customer IDs stay theirs.
+    """
+    STUDENT_DOMAIN = "@student.cbs.dk" # Same rule as account creation
+
+    def __init__(self, customers, search_index, event_log, index_loaded=None):
+        self.customers = customers # user_id -> customer, as recovered from the event log
+        self.search_index = search_index # Also knows the historical customers
+        self.event_log = event_log # Journal for new accounts
+        self.index_loaded = index_loaded # threading.Event set once the index holds the historical customers
+        self._lock = threading.Lock() # An account is created and journaled once, by one session
+
+    def create(self, customer):
+        """
+        Add and journal a new account. Raises ValueError if the customer ID is taken,
+        also by a historical customer.
+        """
+        self._wait_for_index()
+        with self._lock:
+            if customer.user_id in self.customers:
+                raise ValueError(f"Customer '{customer.user_id}' already exists.")
+            self.search_index.add_customer(customer) # Raises ValueError for historical customer IDs
+            self._add(customer)
+
+    def get(self, user_id):
+        """
+        Return the account with the given customer ID, or None if there is no such customer.
+        A historical customer's account is created on first use.
+        """
+        customer = self.customers.get(user_id)
+        if customer is not None:
+            return customer
+        self._wait_for_index()
+        if user_id not in self.search_index.records:
+            return None
+        with self._lock:
+            if user_id in self.customers:
+                return self.customers[user_id] # Another session created it meanwhile
+            name, email, phone = self.search_index.records[user_id]
+            customer_type = StudentUser if email.endswith(self.STUDENT_DOMAIN) else RegularUser
+            customer = customer_type(user_id, name, email, phone)
+            self.search_index.add_customer(customer, existing_ok=True) # Keeps the index in sync with contact changes
+            self._add(customer)
+        return customer
+
+    def _wait_for_index(self):
+        if self.index_loaded is not None:
+            self.index_loaded.wait() # The index is still being built in the background
+
+    def _add(self, customer):
+        self.event_log.customer_created(customer) # Journaled first, so recovery knows every account in use
+        self.customers[customer.user_id] = customer
+
+## Stock
+from itertools import count
+
+class Reservation:
+    """
+    Stock held for a sandwich that has been added to an order but not placed yet.
+    """
+    def __init__(self, reservation_id, items):
+        self.reservation_id = reservation_id # Unique reservation ID
+        self.items = items # {(category, ingredient): quantity}
+        self.created_at = datetime.now() # Used to release reservations of abandoned orders
+        self.committed = False # True once the units have been sold
+
+class StockLevels:
+    """
+    Per-ingredient stock counters shared by every till.
+    Counters are lock-striped: each ingredient maps to one of `stripes` locks, so reservations for
+    different ingredients run in parallel and only tills competing for the same ingredient wait.
+    Ingredients without a stock level are not tracked and never run out.
+    With a `reservation_timeout`, reservations older than that many seconds (e.g. from a closed browser tab)
+    are released by the next reservation, so abandoned orders never keep units from the tills for long.
+    """
+    EXPIRY_CHECK_INTERVAL = 1 # Seconds between scans for expired reservations on the reserve path
+
+    def __init__(self, stripes=16, reservation_timeout=None):
+        self.reservation_timeout = reservation_timeout # Seconds before an open reservation expires; None keeps them
+        self._last_expiry_check = datetime.min # When reserve() last released expired reservations
+        self._locks = [threading.Lock() for _ in range(stripes)] # Lock stripes
+        self._on_hand = {} # (category, ingredient) -> units in stock
+        self._reserved = {} # (category, ingredient) -> units held by open reservations
+        self._reservations = {} # reservation_id -> Reservation
+        self._ids = count(1) # Reservation ID generator
+        self._seeded = False # True once the recovered stock levels have been loaded
+
+    def _locks_for(self, keys):
+        stripes = sorted({hash(key) % len(self._locks) for key in keys}) # Fixed order prevents deadlocks
+        return [self._locks[i] for i in stripes]
+
+    def _acquire(self, keys):
+        locks = self._locks_for(keys)
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    @staticmethod
+    def _release_locks(locks):
+        for lock in reversed(locks):
+            lock.release()
+
+    def set_stock(self, key, quantity):
+        """
+        Set the number of units on hand for an ingredient (e.g. after a delivery).
+        """
+        if quantity < 0:
+            raise ValueError("Stock quantity cannot be negative.")
+        locks = self._acquire([key])
+        try:
+            self._on_hand[key] = quantity
+            self._reserved.setdefault(key, 0)
+        finally:
+            self._release_locks(locks)
+
+    def seed(self, levels):
+        """
+        Load recovered stock levels ({(category, ingredient): quantity}) once; later calls do nothing,
+        so a session that recovers after others have started selling cannot overwrite the live counters.
+        """
+        for lock in self._locks:
+            lock.acquire() # Every stripe, so no till reserves while the levels are loaded
+        try:
+            if self._seeded:
+                return
+            self._seeded = True
+            for key, quantity in levels.items():
+                self._on_hand[key] = quantity
+                self._reserved.setdefault(key, 0)
+        finally:
+            self._release_locks(self._locks)
+
+    def untrack(self, key):
+        """
+        Stop tracking stock for an ingredient.
+        """
+        locks = self._acquire([key])
+        try:
+            self._on_hand.pop(key, None)
+        finally:
+            self._release_locks(locks)
+
+    def available(self, key):
+        """
+        Units that can still be reserved, or None if the ingredient is not tracked.
+        """
+        if key not in self._on_hand:
+            return None
+        return self._on_hand[key] - self._reserved.get(key, 0)
+
+    def reserve(self, items):
+        """
+        Atomically reserve all requested units or none of them.
+        Raises ValueError naming the first ingredient that does not have enough stock.
+        """
+        if self.reservation_timeout is not None:
+            now = datetime.now()
+            if (now - self._last_expiry_check).total_seconds() >= self.EXPIRY_CHECK_INTERVAL:
+                self._last_expiry_check = now
+                self.release_expired(self.reservation_timeout) # Free units held by abandoned orders first
+        locks = self._acquire(items)
+        try:
+            tracked = {key: qty for key, qty in items.items() if key in self._on_hand} # Untracked ingredients are unlimited
+            for key, qty in tracked.items():
+                if self._on_hand[key] - self._reserved[key] < qty:
+                    raise ValueError(f"Sorry, we are out of {key[1]}.")
+            for key, qty in tracked.items():
+                self._reserved[key] += qty
+        finally:
+            self._release_locks(locks)
+        reservation = Reservation(next(self._ids), tracked)
+        self._reservations[reservation.reservation_id] = reservation
+        return reservation
+
+    def commit(self, reservations):
+        """
+        Turn the reservations of an order into a sale: the units leave the stock, for all reservations or none.
+        A reservation that was released in the meantime (e.g. it expired) is taken from the stock again;
+        raises ValueError if that stock has been sold since. Returns the units sold: {(category, ingredient): quantity}.
+        """
+        reservations = [r for r in reservations if not r.committed] # Committing twice sells nothing
+        locks = self._acquire({key for r in reservations for key in r.items})
+        try:
+            released = [r for r in reservations if r.reservation_id not in self._reservations]
+            needed = {}
+            for reservation in released:
+                for key, qty in reservation.items.items():
+                    if key in self._on_hand:
+                        needed[key] = needed.get(key, 0) + qty
+            for key, qty in needed.items():
+                if self._on_hand[key] - self._reserved[key] < qty:
+                    raise ValueError(f"Sorry, we are out of {key[1]}.")
+            sold = {}
+            for reservation in reservations:
+                held = self._reservations.pop(reservation.reservation_id, None) is not None
+                for key, qty in reservation.items.items():
+                    if held:
+                        self._reserved[key] -= qty
+                    if key in self._on_hand:
+                        self._on_hand[key] -= qty
+                        sold[key] = sold.get(key, 0) + qty
+                reservation.committed = True
+        finally:
+            self._release_locks(locks)
+        return sold
+
+    def release(self, reservation):
+        """
+        Give the reserved units back. Returns False if the reservation was already settled.
+        """
+        locks = self._acquire(reservation.items)
+        try:
+            if self._reservations.pop(reservation.reservation_id, None) is None:
+                return False # Committed or released before
+            for key, qty in reservation.items.items():
+                self._reserved[key] -= qty
+        finally:
+            self._release_locks(locks)
+        return True
+
+    def release_expired(self, max_age_seconds):
+        """
+        Release reservations older than `max_age_seconds`, e.g. from orders abandoned in a closed browser tab.
+        Returns the number of reservations released.
+        """
+        now = datetime.now()
+        expired = [r for r in list(self._reservations.values()) if (now - r.created_at).total_seconds() > max_age_seconds]
+        return sum(self.release(r) for r in expired)
+
+    def low_stock(self, threshold):
+        """
+        Return [(category, ingredient, available)] for tracked ingredients at or below the threshold.
+        """
+        low = []
+        for key in list(self._on_hand):
+            locks = self._acquire([key]) # The ingredient may be untracked or sold concurrently
+            try:
+                available = self.available(key)
+            finally:
+                self._release_locks(locks)
+            if available is not None and available <= threshold:
+                low.append((key[0], key[1], available))
+        return sorted(low)
+
 ## Inventory
 class Inventory:
     """
-    Manages available ingredients and their corresponding prices.
+    Manages available ingredients, their corresponding prices and stock levels.
     Allows adding and removing ingredients.
     """
-    def __init__(self):
+    def __init__(self, stock=None):
+        self.stock = stock if stock else StockLevels() # Stock levels; may be shared between inventories
         # Initialize with some default values for each category of ingredients 
         self.available_breads = {
             "White": 0,
@@ -187,6 +448,7 @@ class Inventory:
         if name.startswith("No "): # Prevent removal of "No ..." options if you consider them mandatory placeholders
             raise ValueError(f"Cannot remove mandatory ingredient '{name}'.")
         del category_dict[name] # Remove the ingredient from the dictionary
+        self.stock.untrack((category.lower(), name)) # Stop tracking its stock
 
     def _get_category_dict(self, category):
         category_mapping = {
@@ -199,6 +461,27 @@ class Inventory:
         } # Mapping of category names to corresponding dictionaries
         return category_mapping.get(category.lower()) # Return the dictionary for the specified category
 
+    def set_stock(self, category, name, quantity):
+        """
+        Set the number of units in stock for an ingredient. Ingredients without a stock level never run out.
+        """
+        category_dict = self._get_category_dict(category) # Get the corresponding category dictionary
+        if category_dict is None or name not in category_dict: # Check if the ingredient exists
+            raise ValueError(f"Ingredient '{name}' does not exist in {category} category.")
+        self.stock.set_stock((category.lower(), name), quantity)
+
+    def get_stock(self, category, name):
+        """
+        Return the units that can still be ordered, or None if the ingredient's stock is not tracked.
+        """
+        return self.stock.available((category.lower(), name))
+
+    def reserve(self, items):
+        return self.stock.reserve(items) # Reserve {(category, ingredient): quantity} or raise ValueError
+
+    def low_stock(self, threshold=5):
+        return self.stock.low_stock(threshold) # Tracked ingredients at or below the threshold
+
     def is_valid_bread(self, bread):
         return bread in self.available_breads # Check if the bread is in the available breads
 
@@ -244,6 +527,19 @@ class Sandwich:
         extra_cost = self.inventory.get_extra_cost(valid_extras) # Calculate the total cost of extras
         return base_price + extra_cost # Total price is the sum of the base price and extra cost
 
+    def required_stock(self):
+        """
+        Return the units of each ingredient needed to make this sandwich: {(category, ingredient): quantity}.
+        "No ..." placeholders are not stocked.
+        """
+        selections = [("bread", self.bread), ("spread", self.spread), ("protein", self.protein), ("dressing", self.dressing)]
+        selections += [("vegetable", veg) for veg in self.vegetables] + [("extra", extra) for extra in self.extras]
+        required = {}
+        for key in selections:
+            if key[1] and not key[1].startswith("No "):
+                required[key] = required.get(key, 0) + 1
+        return required
+
     def select_bread(self, bread):
         if self.inventory.is_valid_bread(bread): # Check if the bread is valid
             self.bread = bread # Set the bread type
@@ -314,23 +610,29 @@ class Loyalty:
 from datetime import datetime
 
 class Order:
-    def __init__(self, order_id, customer, order_time=None, inventory=None, loyalty_program=None):
+    def __init__(self, order_id, customer, order_time=None, inventory=None, loyalty_program=None, shop_id="main"):
         """
         Initializes an Order instance with order details and dependencies.
         """
         self.order_id = order_id # Unique order ID
+        self.shop_id = shop_id # Shop the order was placed at
         self.customer = customer # Customer object
         self.sandwiches = [] # List of Sandwich objects
         self.status = "Pending" # Order status
         self.order_time = order_time if order_time else datetime.now() # Order time (default: current time)
         self.inventory = inventory if inventory else Inventory() # Inventory object
         self.loyalty_program = loyalty_program if loyalty_program else Loyalty(10) # Loyalty program object
+        self.reservations = [] # Stock reservations for the sandwiches that have not been placed yet
+        self.placed_seq = None # Event log sequence number of the order_placed event
+        self.updated_seq = None # Event log sequence number of the order's latest change
 
     def add_sandwich(self, sandwich):
         """
-        Adds a sandwich to the order.
+        Adds a sandwich to the order and reserves its ingredients.
+        Raises ValueError if an ingredient is out of stock.
         """
         if isinstance(sandwich, Sandwich): # Check if the input is a Sandwich object
+            self.reservations.append(self.inventory.reserve(sandwich.required_stock())) # Hold the ingredients
             self.sandwiches.append(sandwich) # Add the sandwich to the order
         else:
             raise ValueError("Only Sandwich objects can be added.") # Raise an error for invalid sandwich input
@@ -363,6 +665,23 @@ class Order:
         hour = self.order_time.hour # Get the hour of the order time
         return 77 if 8 <= hour < 14 else 80 # Return the base price based on the time
 
+    def commit_stock(self):
+        """
+        Consume the reserved ingredients when the order is placed and return the units sold.
+        Raises ValueError if a reservation expired and its ingredients have been sold in the meantime.
+        """
+        sold = self.inventory.stock.commit(self.reservations)
+        self.reservations = []
+        return sold
+
+    def release_stock(self):
+        """
+        Return the reserved ingredients when the order is abandoned.
+        """
+        for reservation in self.reservations:
+            self.inventory.stock.release(reservation)
+        self.reservations = []
+
     def update_status(self, new_status):
         """
         Updates the status of the order.
@@ -379,7 +698,43 @@ class Order:
         total, st_discount = self.calculate_total() # Calculate the total cost and discount message
 
         return (f"Order ID: {self.order_id}\n"
+                f"Shop: {self.shop_id}\n"
                 f"Customer: {self.customer.name} (ID: {self.customer.user_id})\n"
                 f"Sandwiches:\n{sandwiches_str}\n"
                 f"Status: {self.status}\n"
                 f"Total Cost: {total:.2f} DKK{st_discount}") # Return the order details
+
+## Shop
+class Shop:
+    """
+    One shop location with its own inventory, orders and kitchen board.
+    Customers and the loyalty program are shared between shops.
+    """
+    def __init__(self, shop_id, name, inventory=None):
+        self.shop_id = shop_id # Unique shop ID
+        self.name = name # Display name of the shop
+        self.inventory = inventory if inventory else Inventory() # This shop's ingredients and stock
+        self.orders = [] # Orders placed at this shop
+        self.lock = threading.RLock() # Every session works on the same Shop; held while its orders change
+
+    def add_order(self, order):
+        """
+        Add an order placed at this shop.
+        """
+        if order.shop_id != self.shop_id:
+            raise ValueError(f"Order {order.order_id} belongs to shop '{order.shop_id}', not '{self.shop_id}'.")
+        with self.lock:
+            self.orders.append(order)
+
+    def orders_by_status(self, statuses):
+        """
+        Group this shop's orders by status for the kitchen board: {status: [orders]}.
+        """
+        board = {status: [] for status in statuses}
+        with self.lock: # No order changes status while the board is built
+            for order in self.orders:
+                board.setdefault(order.status, []).append(order)
+        return board
+
+    def __str__(self):
+        return f"Shop ID: {self.shop_id}\nName: {self.name}\nOrders: {len(self.orders)}"
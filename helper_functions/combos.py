@@ -0,0 +1,121 @@
+import threading
+
+from helper_functions.sketches import HeavyHitters
+
+# Incremental ingredient co-occurrence statistics for combo analytics and "popular combos" suggestions
+
+def configuration_key(sandwich):
+    """
+    Hashable description of a sandwich, so identical configurations are counted together:
+    (bread, spread, protein, vegetables, dressing, extras).
+    """
+    return (
+        sandwich.bread, sandwich.spread, sandwich.protein,
+        tuple(sorted(sandwich.vegetables)), sandwich.dressing, tuple(sorted(sandwich.extras)),
+    )
+
+
+def describe_configuration(configuration):
+    """
+    Short text for a configuration, leaving out the "No ..." placeholders.
+    """
+    bread, spread, protein, vegetables, dressing, extras = configuration
+    parts = [bread, spread, protein, *vegetables, dressing, *extras]
+    return ", ".join(part for part in parts if part and not part.startswith("No "))
+
+
+class CoOccurrenceMatrix:
+    """
+    Sparse, symmetric matrix of how often two ingredients appear in the same sandwich.
+    Ingredients get integer ids the first time they are seen and each row only stores the partners
+    that actually occurred, so memory is bounded by the (small) ingredient vocabulary.
+    Popular full configurations are tracked with a bounded heavy-hitters sketch.
+    Query results are cached and only recomputed for rows that changed.
+    """
+    def __init__(self, max_configurations=200):
+        self._lock = threading.Lock()
+        self._ids = {} # (category, ingredient) -> id
+        self.ingredients = [] # id -> (category, ingredient)
+        self.counts = [] # id -> number of sandwiches containing the ingredient
+        self._pairs = [] # id -> {partner id: number of sandwiches containing both}
+        self._partners_cache = {} # id -> partners sorted by count, dropped when the row changes
+        self.configurations = HeavyHitters(capacity=max_configurations) # Popular full configurations
+        self._popular_cache = None # Cached configurations.top(), dropped on every update
+        self.sandwiches = 0 # Number of sandwiches recorded
+        self.seeded = False # True once the existing order history has been added
+
+    def _id(self, key):
+        if key not in self._ids:
+            self._ids[key] = len(self.ingredients)
+            self.ingredients.append(key)
+            self.counts.append(0)
+            self._pairs.append({})
+        return self._ids[key]
+
+    def add_sandwich(self, sandwich):
+        """
+        Record one sandwich: update the counts of its ingredients and of every ingredient pair.
+        """
+        with self._lock:
+            ids = [self._id(key) for key in sandwich.required_stock()] # "No ..." placeholders are skipped
+            for i in ids:
+                self.counts[i] += 1
+                row = self._pairs[i]
+                for j in ids:
+                    if j != i:
+                        row[j] = row.get(j, 0) + 1
+                self._partners_cache.pop(i, None) # Only the changed rows are recomputed
+            self.configurations.add(configuration_key(sandwich))
+            self._popular_cache = None
+            self.sandwiches += 1
+
+    def add_orders(self, orders):
+        """
+        Record every sandwich of the given orders.
+        """
+        for order in orders:
+            for sandwich in order.sandwiches:
+                self.add_sandwich(sandwich)
+
+    def seed(self, orders):
+        """
+        Add the existing order history once; later calls do nothing.
+        """
+        with self._lock:
+            if self.seeded:
+                return
+            self.seeded = True
+        self.add_orders(orders)
+
+    def top_partners(self, category, ingredient, k=5):
+        """
+        Return up to k [(partner ingredient, sandwiches with both, share of this ingredient's sandwiches)].
+        """
+        with self._lock:
+            i = self._ids.get((category, ingredient))
+            if i is None:
+                return []
+            partners = self._partners_cache.get(i)
+            if partners is None:
+                partners = sorted(self._pairs[i].items(), key=lambda pair: pair[1], reverse=True)
+                self._partners_cache[i] = partners
+            return [
+                (self.ingredients[j][1], count, count / self.counts[i])
+                for j, count in partners[:k]
+            ]
+
+    def popular_configurations(self, n=5):
+        """
+        Return up to n [(configuration, approximate number of sandwiches)] from the cache.
+        """
+        with self._lock:
+            if self._popular_cache is None:
+                self._popular_cache = self.configurations.top(self.configurations.capacity)
+            return self._popular_cache[:n]
+
+    def known_ingredients(self):
+        """
+        Return the (category, ingredient) pairs seen so far.
+        """
+        with self._lock:
+            return list(self.ingredients)
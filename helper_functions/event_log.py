@@ -0,0 +1,396 @@
+import json
+import os
+import pickle
+import threading
+from datetime import datetime
+
+from helper_functions.classes import RegularUser, StudentUser, AdminUser, Inventory, Sandwich, Order
+
+# Write-ahead event log with group commit and periodic snapshots for crash recovery
+
+LOG_PATH = "data/events.log" # Append-only journal of mutations, one JSON event per line
+SNAPSHOT_PATH = "data/snapshot.pkl" # Compact snapshot of customers, orders, inventory and stock
+SNAPSHOT_EVERY = 5_000 # Take a snapshot after this many events have been logged since the last one
+
+USER_TYPES = {"RegularUser": RegularUser, "StudentUser": StudentUser, "AdminUser": AdminUser}
+CATEGORIES = ["bread", "spread", "protein", "vegetable", "extra", "dressing"]
+
+
+## Records
+def customer_record(customer):
+    """
+    Plain representation of a customer used in events and snapshots.
+    """
+    return {
+        "user_id": customer.user_id,
+        "name": customer.name,
+        "email": customer.email,
+        "phone": customer.phone,
+        "type": type(customer).__name__,
+    }
+
+
+def order_record(order):
+    """
+    Plain representation of an order (including its sandwiches) used in events and snapshots.
+    """
+    return {
+        "order_id": order.order_id,
+        "shop_id": order.shop_id,
+        "customer_id": order.customer.user_id,
+        "order_time": order.order_time.isoformat(), # ISO format parses much faster than strptime on replay
+        "status": order.status,
+        "sandwiches": [
+            [s.bread, s.spread, s.protein, list(s.vegetables), s.dressing, list(s.extras)]
+            for s in order.sandwiches
+        ],
+    }
+
+
+def inventory_record(inventory):
+    """
+    Plain representation of the inventory: category -> {ingredient: price}.
+    """
+    return {category: dict(inventory._get_category_dict(category)) for category in CATEGORIES}
+
+
+## Replay
+# Events are replayed onto plain records first: that is cheap, and it is all a snapshot needs.
+# Objects are only built from the records when the state is recovered.
+def empty_state():
+    return {
+        "customers": {}, # user_id -> customer record
+        "orders": {}, # order_id -> order record, in the order they were placed
+        "inventories": {}, # shop_id -> inventory record
+        "stock": {}, # shop_id -> {category: {ingredient: units on hand}}; untracked ingredients are absent
+    }
+
+
+def load_snapshot(state, snapshot):
+    """
+    Load the records of a snapshot into an empty state.
+    """
+    state["customers"].update((record["user_id"], record) for record in snapshot["customers"])
+    state["orders"].update((record["order_id"], record) for record in snapshot["orders"])
+    if "inventories" in snapshot:
+        state["inventories"].update(snapshot["inventories"])
+    else:
+        state["inventories"]["main"] = snapshot["inventory"] # Snapshots taken before shops existed
+    state["stock"].update(snapshot.get("stock", {})) # Snapshots taken before stock was journaled have none
+
+
+def shop_record(state, shop_id):
+    if shop_id not in state["inventories"]:
+        state["inventories"][shop_id] = inventory_record(Inventory()) # Shops without logged changes use the defaults
+    return state["inventories"][shop_id]
+
+
+def shop_stock(state, shop_id, category):
+    return state["stock"].setdefault(shop_id, {}).setdefault(category, {})
+
+
+def apply_event(state, event):
+    """
+    Apply a single logged event to the state's records.
+    """
+    event_type = event["type"]
+    if event_type == "customer_created":
+        state["customers"][event["customer"]["user_id"]] = event["customer"]
+    elif event_type == "contact_updated":
+        record = state["customers"][event["user_id"]]
+        if event.get("email"):
+            record["email"] = event["email"]
+        if event.get("phone"):
+            record["phone"] = event["phone"]
+    elif event_type == "order_placed":
+        record = event["order"]
+        record["placed_seq"] = record["updated_seq"] = event["seq"] # Change watermarks for incremental exports
+        state["orders"][record["order_id"]] = record
+        for category, name, quantity in event.get("sold", []): # Units that left the stock with the order
+            stock = shop_stock(state, event["order"].get("shop_id", "main"), category)
+            if name in stock:
+                stock[name] -= quantity
+    elif event_type == "order_status_updated":
+        record = state["orders"][event["order_id"]]
+        record["status"] = event["status"]
+        record["updated_seq"] = event["seq"]
+    elif event_type == "ingredient_added":
+        shop_record(state, event.get("shop_id", "main"))[event["category"]][event["name"]] = event["price"]
+    elif event_type == "ingredient_removed":
+        shop_record(state, event.get("shop_id", "main"))[event["category"]].pop(event["name"], None)
+        shop_stock(state, event.get("shop_id", "main"), event["category"]).pop(event["name"], None) # No longer tracked
+    elif event_type == "stock_set":
+        shop_stock(state, event["shop_id"], event["category"])[event["name"]] = event["quantity"]
+    else:
+        raise ValueError(f"Unknown event type '{event_type}'.")
+
+
+def restore_inventory(record):
+    inventory = Inventory()
+    for category, ingredients in record.items():
+        category_dict = inventory._get_category_dict(category)
+        category_dict.clear()
+        category_dict.update(ingredients) # Restore ingredients and prices
+    return inventory
+
+
+def restore_customer(record):
+    return USER_TYPES.get(record["type"], RegularUser)(
+        record["user_id"], record["name"], record["email"], record["phone"]
+    ) # Recreate the customer with its original type
+
+
+def restore_order(record, customers, inventories):
+    customer = customers[record["customer_id"]]
+    shop_id = record.get("shop_id", "main") # Events logged before shops existed belong to the main shop
+    if shop_id not in inventories:
+        inventories[shop_id] = Inventory() # Shops without logged changes use the defaults
+    inventory = inventories[shop_id]
+    order = Order(
+        order_id=record["order_id"],
+        customer=customer,
+        order_time=datetime.fromisoformat(record["order_time"]),
+        inventory=inventory,
+        shop_id=shop_id,
+    )
+    for bread, spread, protein, vegetables, dressing, extras in record["sandwiches"]:
+        sandwich = Sandwich(inventory=inventory)
+        # Assigned directly: an ingredient may have been removed from the inventory since the order was placed
+        sandwich.bread, sandwich.spread, sandwich.protein = bread, spread, protein
+        sandwich.vegetables, sandwich.dressing, sandwich.extras = vegetables, dressing, extras
+        order.sandwiches.append(sandwich)
+    order.status = record["status"]
+    order.placed_seq = record.get("placed_seq") # Snapshots taken before the watermarks existed have none
+    order.updated_seq = record.get("updated_seq")
+    customer.add_order(order) # Rebuilds order history and sandwich count
+    return order
+
+
+class EventLog:
+    """
+    Durable journal of every mutation to customers, orders, inventory and stock.
+
+    Appends are group-committed: a background thread writes everything that was appended while the
+    previous flush was running and calls fsync once for the whole batch, so concurrent tills share a
+    single disk flush. `append` returns once its event is durable.
+    Snapshots bound the replay work: recovery loads the last snapshot and replays only the log tail.
+    A snapshot is built from the previous snapshot plus the log, never from one session's view of the
+    state, so the events of every session are kept.
+    """
+    def __init__(self, log_path=LOG_PATH, snapshot_path=SNAPSHOT_PATH, snapshot_every=SNAPSHOT_EVERY):
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+
+        self._cond = threading.Condition() # Guards the buffer and sequence numbers
+        self._io_lock = threading.Lock() # Serializes log writes with snapshot truncation
+        self._snapshot_lock = threading.Lock() # Keeps recovery from reading the files while a snapshot replaces them
+        self._snapshotting = False # True while a background snapshot is running
+        self._buffer = [] # Serialized events waiting for the next group commit
+        self._snapshot = self._read_snapshot() # Kept until first use so the snapshot is only loaded once
+        self._snapshot_seq = self._snapshot["seq"] if self._snapshot else 0 # Last sequence number covered by the snapshot
+        self._seq = max(self._snapshot_seq, self._repair_log()) # Last assigned sequence number
+        self._durable_seq = self._seq # Last sequence number known to be on disk
+        self._closed = False
+        self._file = open(log_path, "a", encoding="utf-8")
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    ## Appending
+    def append(self, event_type, wait=True, **payload):
+        """
+        Append an event and, unless `wait=False`, block until it has been fsynced.
+        Returns the event's sequence number.
+        """
+        with self._cond:
+            if self._closed:
+                raise ValueError("Event log is closed.")
+            self._seq += 1
+            seq = self._seq
+            self._buffer.append(json.dumps({"seq": seq, "type": event_type, **payload}) + "\n")
+            self._cond.notify_all() # Wake the flusher
+            while wait and self._durable_seq < seq:
+                self._cond.wait()
+        return seq
+
+    def customer_created(self, customer):
+        return self.append("customer_created", customer=customer_record(customer))
+
+    def contact_updated(self, customer, email=None, phone=None):
+        return self.append("contact_updated", user_id=customer.user_id, email=email, phone=phone)
+
+    def order_placed(self, order, sold=None):
+        # `sold` is the {(category, ingredient): quantity} taken from the stock, logged with the order in one event
+        sold = [[category, name, quantity] for (category, name), quantity in (sold or {}).items()]
+        order.placed_seq = order.updated_seq = self.append("order_placed", order=order_record(order), sold=sold)
+        return order.placed_seq
+
+    def order_status_updated(self, order):
+        order.updated_seq = self.append("order_status_updated", order_id=order.order_id, status=order.status)
+        return order.updated_seq
+
+    def ingredient_added(self, category, name, price, shop_id="main"):
+        return self.append("ingredient_added", shop_id=shop_id, category=category.lower(), name=name, price=price)
+
+    def ingredient_removed(self, category, name, shop_id="main"):
+        return self.append("ingredient_removed", shop_id=shop_id, category=category.lower(), name=name)
+
+    def stock_set(self, category, name, quantity, shop_id="main"):
+        return self.append("stock_set", shop_id=shop_id, category=category.lower(), name=name, quantity=quantity)
+
+    def sync(self):
+        """
+        Block until every event appended so far is on disk.
+        """
+        with self._cond:
+            target = self._seq
+            while self._durable_seq < target:
+                self._cond.wait()
+        return target
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer:
+                    return # Closed and fully flushed
+                lines, self._buffer = self._buffer, [] # Take the whole batch
+                last_seq = self._seq
+            with self._io_lock:
+                self._file.write("".join(lines))
+                self._file.flush()
+                os.fsync(self._file.fileno()) # One disk flush for the whole batch
+            with self._cond:
+                self._durable_seq = last_seq
+                self._cond.notify_all() # Release every appender in the batch
+
+    def close(self):
+        """
+        Flush outstanding events and stop the background flusher.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        self._file.close()
+
+    ## Snapshots
+    def maybe_snapshot(self):
+        """
+        Start a background snapshot if enough events have been logged since the last one.
+        """
+        with self._cond:
+            if self._snapshotting or self._seq - self._snapshot_seq < self.snapshot_every:
+                return
+            self._snapshotting = True
+        threading.Thread(target=self._snapshot_in_background, daemon=True).start()
+
+    def _snapshot_in_background(self):
+        try:
+            self.snapshot()
+        finally:
+            with self._cond:
+                self._snapshotting = False
+
+    def snapshot(self):
+        """
+        Write a compact snapshot of everything logged so far and drop the log lines it makes redundant.
+        The snapshot is the previous snapshot plus the logged events, replayed on plain records.
+        It is written to a temporary file and renamed, so a crash never leaves a partial snapshot.
+        """
+        seq = self.sync() # The snapshot must not be ahead of the log
+        with self._snapshot_lock:
+            if seq <= self._snapshot_seq:
+                return # Already covered by a newer snapshot
+            state = self._replay(up_to=seq) # Appends continue while the events are replayed
+            snapshot = {
+                "seq": seq,
+                "customers": list(state["customers"].values()),
+                "orders": list(state["orders"].values()),
+                "inventories": state["inventories"], # Per shop
+                "stock": state["stock"], # Per shop
+            }
+            temp_path = self.snapshot_path + ".tmp"
+            with open(temp_path, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path) # Atomic switch to the new snapshot
+            with self._io_lock:
+                # Keep the events appended since `seq`; everything before it is in the snapshot
+                tail = [line for line, event in self._read_lines() if event["seq"] > seq]
+                self._file.truncate(0)
+                self._file.write("".join(tail))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._snapshot_seq = seq
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, "rb") as f:
+            return pickle.load(f)
+
+    def _read_lines(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield line, json.loads(line)
+                except json.JSONDecodeError:
+                    return # Torn write at the end of the log; the event was never acknowledged
+
+    def _read_events(self):
+        for _, event in self._read_lines():
+            yield event
+
+    def _repair_log(self):
+        # Cut off a torn write left by a crash, so new events are not appended to a partial line.
+        # Returns the last logged sequence number.
+        last, valid_bytes = 0, 0
+        for line, event in self._read_lines():
+            if not line.endswith("\n"):
+                break # Complete JSON but no newline: the write was cut off
+            last = event["seq"]
+            valid_bytes += len(line.encode("utf-8"))
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > valid_bytes:
+            with open(self.log_path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return last
+
+    def _replay(self, up_to=None):
+        # Rebuild the records from the snapshot plus the logged events up to sequence number `up_to`
+        state = empty_state()
+        snapshot, self._snapshot = self._snapshot or self._read_snapshot(), None # Release the cached snapshot after use
+        snapshot_seq = 0
+        if snapshot:
+            snapshot_seq = snapshot["seq"]
+            load_snapshot(state, snapshot)
+        for event in self._read_events():
+            if up_to is not None and event["seq"] > up_to:
+                break
+            if event["seq"] > snapshot_seq: # Older events are already part of the snapshot
+                apply_event(state, event)
+        return state
+
+    ## Recovery
+    def recover(self):
+        """
+        Rebuild customers, orders, the shops' inventories and stock levels from the last snapshot plus the log tail.
+        Returns a (customers, orders, inventories, stock) tuple, where inventories maps shop_id -> Inventory
+        and stock maps shop_id -> {(category, ingredient): units on hand}.
+        """
+        with self._snapshot_lock:
+            state = self._replay()
+        inventories = {shop_id: restore_inventory(record) for shop_id, record in state["inventories"].items()}
+        customers = {user_id: restore_customer(record) for user_id, record in state["customers"].items()}
+        orders = [restore_order(record, customers, inventories) for record in state["orders"].values()]
+        stock = {
+            shop_id: {(category, name): quantity for category, levels in categories.items() for name, quantity in levels.items()}
+            for shop_id, categories in state["stock"].items()
+        }
+        return customers, orders, inventories, stock
@@ -0,0 +1,265 @@
+import itertools
+import json
+import os
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Helper functions to export orders and sandwich lines to Parquet, partitioned by month
+
+EXPORT_DIR = "exports" # Default root folder for the Parquet datasets
+STATE_FILE = "_last_export.json" # Bookkeeping file for incremental ("since last export") runs
+CHUNK_SIZE = 10_000 # Number of rows held in memory before a chunk is flushed to disk
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S" # Same format as the "Order Time" column in orders_df
+
+ORDERS_SCHEMA = pa.schema([
+    ("Order ID", pa.int64()),
+    ("Shop ID", pa.string()),
+    ("Customer ID", pa.string()),
+    ("Order Time", pa.timestamp("s")),
+    ("Number of Sandwiches", pa.int64()),
+    ("Total Cost (DKK)", pa.float64()),
+    ("Status", pa.string()),
+    ("Change Seq", pa.int64()), # Event log sequence number of the exported version; 0 for historical orders
+    ("month", pa.string()),
+])
+
+SANDWICH_LINES_SCHEMA = pa.schema([
+    ("Order ID", pa.int64()),
+    ("Line Number", pa.int64()),
+    ("Shop ID", pa.string()),
+    ("Customer ID", pa.string()),
+    ("Order Time", pa.timestamp("s")),
+    ("Bread", pa.string()),
+    ("Spread", pa.string()),
+    ("Protein", pa.string()),
+    ("Vegetables", pa.list_(pa.string())),
+    ("Dressing", pa.string()),
+    ("Extras", pa.list_(pa.string())),
+    ("Price (DKK)", pa.float64()),
+    ("month", pa.string()),
+])
+
+def order_rows(orders_df, since=None, chunk_size=CHUNK_SIZE, skip_ids=()):
+    """
+    Yield one export row per historical order in the orders dataframe, optionally only those placed after `since`.
+    Orders in `skip_ids` are exported from their Order objects by journaled_order_rows instead.
+    The dataframe is converted slice by slice so only `chunk_size` records are materialized at a time.
+    """
+    for start in range(0, len(orders_df), chunk_size):
+        for record in orders_df.iloc[start:start + chunk_size].to_dict("records"):
+            if record["Order ID"] in skip_ids:
+                continue
+            order_time = datetime.strptime(str(record["Order Time"]), TIME_FORMAT)
+            status = record.get("Status")
+            shop_id = record.get("Shop ID")
+            if since and order_time <= since:
+                continue # Already exported in a previous run
+            yield {
+                "Order ID": int(record["Order ID"]),
+                "Shop ID": shop_id if isinstance(shop_id, str) else "main", # Historical data has no shop
+                "Customer ID": record["Customer ID"],
+                "Order Time": order_time,
+                "Number of Sandwiches": int(record["Number of Sandwiches"]),
+                "Total Cost (DKK)": float(record["Total Cost (DKK)"]),
+                "Status": status if isinstance(status, str) else None, # Preloaded CSV data has no status
+                "Change Seq": 0, # Historical orders never change
+                "month": order_time.strftime("%Y-%m"),
+            }
+
+
+def journaled_order_rows(orders, since_seq=None):
+    """
+    Yield one export row per journaled Order object, optionally only for orders placed or changed after
+    event log sequence number `since_seq`. A changed order is exported again with its new "Change Seq".
+    """
+    for order in orders:
+        change_seq = order.updated_seq or 0 # Read before the status: a status change sets the status first, then the seq
+        if since_seq is not None and change_seq <= since_seq:
+            continue # Unchanged since the previous export
+        order_time = order.order_time.replace(microsecond=0)
+        yield {
+            "Order ID": int(order.order_id),
+            "Shop ID": order.shop_id,
+            "Customer ID": order.customer.user_id,
+            "Order Time": order_time,
+            "Number of Sandwiches": len(order.sandwiches),
+            "Total Cost (DKK)": float(order.calculate_total()[0]),
+            "Status": order.status,
+            "Change Seq": change_seq,
+            "month": order_time.strftime("%Y-%m"),
+        }
+
+
+def sandwich_line_rows(orders, since_seq=None):
+    """
+    Yield one export row per sandwich in the given Order objects, optionally only for orders placed after
+    event log sequence number `since_seq`. Sandwiches never change once the order is placed.
+    """
+    for order in orders:
+        if since_seq is not None and (order.placed_seq or 0) <= since_seq:
+            continue # Already exported in a previous run
+        order_time = order.order_time.replace(microsecond=0)
+        base_price = order.get_time_based_price() # Base price that applied when the order was placed
+        for line_number, sandwich in enumerate(order.sandwiches, start=1):
+            yield {
+                "Order ID": int(order.order_id),
+                "Line Number": line_number,
+                "Shop ID": order.shop_id,
+                "Customer ID": order.customer.user_id,
+                "Order Time": order_time,
+                "Bread": sandwich.bread,
+                "Spread": sandwich.spread,
+                "Protein": sandwich.protein,
+                "Vegetables": list(sandwich.vegetables),
+                "Dressing": sandwich.dressing,
+                "Extras": list(sandwich.extras),
+                "Price (DKK)": float(sandwich.get_price(base_price)),
+                "month": order_time.strftime("%Y-%m"),
+            }
+
+
+def write_partitioned(rows, schema, root_path, chunk_size=CHUNK_SIZE):
+    """
+    Stream rows into a Parquet dataset under `root_path`, partitioned by month (hive style: month=YYYY-MM).
+    Rows are buffered and flushed every `chunk_size` rows, so memory stays bounded regardless of history size.
+    Every column, including the leaves of the list columns, is dictionary encoded, so ingredient names,
+    shop and customer IDs are stored once per row group; Parquet falls back to plain encoding on its own
+    for columns whose dictionary grows too large.
+    Returns the number of rows written.
+    """
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S%f") # Unique per run so incremental exports never overwrite files
+    buffer = []
+    written = 0
+    chunk_number = 0
+
+    def flush():
+        table = pa.Table.from_pylist(buffer, schema=schema) # Convert the buffered rows to an Arrow table
+        pq.write_to_dataset(
+            table,
+            root_path,
+            partition_cols=["month"],
+            basename_template=f"part-{run_id}-{chunk_number}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            use_dictionary=True,
+        )
+
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= chunk_size:
+            flush() # Write the full chunk to disk
+            written += len(buffer)
+            chunk_number += 1
+            buffer = []
+    if buffer:
+        flush() # Write the remaining rows
+        written += len(buffer)
+    return written
+
+
+def load_last_export(export_dir=EXPORT_DIR):
+    """
+    Return the watermarks of the last export: {"last_order_time": datetime or None, "last_seq": int or None}.
+    """
+    state_path = os.path.join(export_dir, STATE_FILE)
+    if not os.path.exists(state_path):
+        return {"last_order_time": None, "last_seq": None}
+    with open(state_path) as f:
+        state = json.load(f)
+    last_order_time = state.get("last_order_time")
+    return {
+        "last_order_time": datetime.strptime(last_order_time, TIME_FORMAT) if last_order_time else None,
+        "last_seq": state.get("last_seq"), # Exports made before the change watermark re-export journaled orders once
+    }
+
+
+def save_last_export(last_order_time, last_seq, export_dir=EXPORT_DIR):
+    """
+    Record how far the export got: the newest historical order time and the newest journaled change
+    (event log sequence number), so the next run only picks up what is new or changed.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    with open(os.path.join(export_dir, STATE_FILE), "w") as f:
+        json.dump({
+            "last_order_time": last_order_time.strftime(TIME_FORMAT) if last_order_time else None,
+            "last_seq": last_seq,
+        }, f)
+
+
+def export_to_parquet(orders_df, orders, export_dir=EXPORT_DIR, incremental=True, chunk_size=CHUNK_SIZE):
+    """
+    Export the historical orders in the orders dataframe, the journaled Order objects and their sandwich lines to Parquet.
+    With `incremental=True` only new historical orders and journaled orders placed or changed since the previous
+    export are written. Journaled orders are tracked by event log sequence number rather than order time,
+    so status changes of orders that were already exported are exported too.
+    Returns a dict with the number of order and sandwich-line rows written.
+    """
+    last = load_last_export(export_dir) if incremental else {"last_order_time": None, "last_seq": None}
+    since, since_seq = last["last_order_time"], last["last_seq"]
+    watermarks = {"time": since, "seq": since_seq} # Advanced while streaming
+
+    def track(rows):
+        for row in rows:
+            if row["Change Seq"]:
+                watermarks["seq"] = max(watermarks["seq"] or 0, row["Change Seq"])
+            elif watermarks["time"] is None or row["Order Time"] > watermarks["time"]:
+                watermarks["time"] = row["Order Time"]
+            yield row
+
+    journaled_ids = {order.order_id for order in orders}
+    rows = itertools.chain(
+        order_rows(orders_df, since, chunk_size, skip_ids=journaled_ids),
+        journaled_order_rows(orders, since_seq),
+    )
+    orders_written = write_partitioned(
+        track(rows),
+        ORDERS_SCHEMA,
+        os.path.join(export_dir, "orders"),
+        chunk_size,
+    )
+    lines_written = write_partitioned(
+        sandwich_line_rows(orders, since_seq),
+        SANDWICH_LINES_SCHEMA,
+        os.path.join(export_dir, "sandwich_lines"),
+        chunk_size,
+    )
+
+    if watermarks != {"time": since, "seq": since_seq}:
+        save_last_export(watermarks["time"], watermarks["seq"], export_dir) # Remember where this export stopped
+    return {"orders": orders_written, "sandwich_lines": lines_written}
+
+
+def latest_versions(table):
+    """
+    Keep only the latest exported version (highest "Change Seq") of each order.
+    """
+    if table.num_rows == 0:
+        return table
+    table = table.sort_by([("Order ID", "ascending"), ("Change Seq", "descending")])
+    ids = table.column("Order ID").combine_chunks()
+    first = pc.not_equal(ids.slice(1), ids.slice(0, len(ids) - 1)) # True where a new order starts
+    return table.filter(pa.concat_arrays([pa.array([True]), first]))
+
+
+def read_month(month, table="orders", export_dir=EXPORT_DIR, columns=None, filter=None):
+    """
+    Read a single month (YYYY-MM) of an exported table.
+    The month filter is pushed down to the partition layout, so other months are never opened;
+    an extra `filter` expression (e.g. ds.field("Protein") == "Tuna") is pushed down to the row groups.
+    Orders are exported again when their status changes, so the orders table returns only the latest
+    version of each order; its `filter` is applied after that, to the current versions.
+    """
+    dataset = ds.dataset(os.path.join(export_dir, table), format="parquet", partitioning="hive")
+    expression = ds.field("month") == month
+    if table != "orders":
+        if filter is not None:
+            expression = expression & filter # Combine with the caller's predicate
+        return dataset.to_table(columns=columns, filter=expression)
+
+    orders = latest_versions(dataset.to_table(filter=expression))
+    if filter is not None:
+        orders = orders.filter(filter)
+    return orders.select(columns) if columns is not None else orders
@@ -0,0 +1,218 @@
+import csv
+import threading
+from bisect import bisect_left, insort
+from operator import itemgetter
+
+# In-memory customer search index used by the admin customer directory
+
+class CustomerSearchIndex:
+    """
+    Prefix index over customer name tokens, email and phone number.
+    Every key is kept in one sorted list, so a lookup is a binary search followed by a short scan
+    and stays well under a millisecond even with a million customers.
+    Phone numbers are also indexed by their last four digits, which is what staff usually ask for.
+    One index is shared by every session, so all reads and writes hold a lock.
+    """
+    PHONE_SUFFIX_LENGTH = 4 # Length of the phone number suffix that is indexed as its own key
+    MAX_FILTER_KEYS = 50_000 # Terms matching at most this many keys are checked with a set of their user_ids
+    MAX_CANDIDATE_CHECKS = 1_000 # Candidates checked one by one against larger terms before intersecting instead
+    PHONE_CHARACTERS = set("0123456789+-()") # A query term made of these is (part of) a phone number
+
+    def __init__(self):
+        self._lock = threading.RLock() # Reentrant: update() calls remove() and add()
+        self.records = {} # user_id -> (name, email, phone)
+        self._keys = [] # Sorted list of (key, user_id)
+        self._ids = [] # Sorted list of user_ids, used to page through the full directory
+
+    @staticmethod
+    def normalize(text):
+        return str(text).strip().lower() # Case-insensitive matching
+
+    @staticmethod
+    def _digits(phone):
+        return "".join(c for c in str(phone) if c.isdigit()) # "+45 12 34" -> "451234"
+
+    def _keys_for(self, user_id, name, email, phone):
+        keys = {self.normalize(token) for token in str(name).split()} # Each word of the name
+        keys.add(self.normalize(email)) # Full email; prefix matching also covers the local part
+        digits = self._digits(phone)
+        if digits:
+            keys.add(digits) # Full phone number
+            keys.add(digits[-self.PHONE_SUFFIX_LENGTH:]) # Last digits of the phone number
+        keys.add(self.normalize(user_id)) # Customer ID
+        return [(key, user_id) for key in keys if key]
+
+    def add(self, user_id, name, email, phone):
+        """
+        Add a customer to the index. Raises ValueError if the customer is already indexed.
+        """
+        with self._lock:
+            if user_id in self.records:
+                raise ValueError(f"Customer '{user_id}' is already indexed.")
+            self.records[user_id] = (name, email, phone)
+            for entry in self._keys_for(user_id, name, email, phone):
+                insort(self._keys, entry) # Keep the key list sorted
+            insort(self._ids, user_id)
+
+    def add_many(self, rows):
+        """
+        Bulk-load (user_id, name, email, phone) rows, sorting the keys once instead of per insert.
+        The keys are built and sorted before taking the lock, so searches only wait while they are merged in.
+        """
+        records = {}
+        keys = []
+        for user_id, name, email, phone in rows:
+            if user_id in records:
+                raise ValueError(f"Customer '{user_id}' is already indexed.")
+            records[user_id] = (name, email, phone)
+            keys.extend(self._keys_for(user_id, name, email, phone))
+        keys.sort()
+        with self._lock:
+            already_indexed = records.keys() & self.records.keys()
+            if already_indexed:
+                raise ValueError(f"Customer '{min(already_indexed)}' is already indexed.")
+            self.records.update(records)
+            self._keys = sorted(self._keys + keys) if self._keys else keys # Merging two sorted runs is linear
+            self._ids = sorted(self.records)
+
+    def load_csv(self, path):
+        """
+        Bulk-load customers from a CSV file with "Customer ID", "Name", "Email" and "Phone" columns.
+        Uses the csv module so building the index does not require pandas.
+        """
+        with open(path, newline="", encoding="utf-8") as f:
+            self.add_many(
+                (row["Customer ID"], row["Name"], row["Email"], row["Phone"]) for row in csv.DictReader(f)
+            )
+
+    def add_customer(self, customer, existing_ok=False):
+        """
+        Index a User object and keep it in sync when its contact information changes.
+        With `existing_ok`, a customer that is already indexed (e.g. recovered by another session)
+        is re-indexed with the object's contact information instead of raising ValueError.
+        """
+        details = (customer.name, customer.email, customer.phone)
+        with self._lock:
+            if not existing_ok or customer.user_id not in self.records:
+                self.add(customer.user_id, *details)
+            elif self.records[customer.user_id] != details:
+                self.update(customer.user_id, *details)
+        customer.search_index = self # update_contact_info calls back into the index
+
+    def remove(self, user_id):
+        """
+        Remove a customer and all of its keys from the index.
+        """
+        with self._lock:
+            if user_id not in self.records:
+                raise ValueError(f"Customer '{user_id}' is not indexed.")
+            for entry in self._keys_for(user_id, *self.records.pop(user_id)):
+                position = bisect_left(self._keys, entry)
+                del self._keys[position] # The entry is guaranteed to be present
+            del self._ids[bisect_left(self._ids, user_id)]
+
+    def update(self, user_id, name, email, phone):
+        """
+        Re-index a customer whose name, email or phone number changed.
+        """
+        with self._lock:
+            self.remove(user_id)
+            self.add(user_id, name, email, phone)
+
+    def search(self, query, offset=0, limit=20):
+        """
+        Return up to `limit` user_ids matching the query, skipping the first `offset` matches,
+        together with a flag telling whether more matches exist.
+        Every word of the query must be a prefix of the customer's name, email, phone or ID.
+        An empty query pages through all customers ordered by ID.
+        """
+        terms = []
+        number = False # Whether the previous term was part of a phone number
+        for term in map(self.normalize, str(query).split()):
+            if self._digits(term) and set(term) <= self.PHONE_CHARACTERS:
+                if number:
+                    terms[-1] += self._digits(term) # "+45 11 22 33 44" is one phone number, "4511223344"
+                    continue
+                term = self._digits(term) # "+45..." -> "45..."
+                number = True
+            else:
+                number = False
+            terms.append(term)
+        with self._lock: # Another session may be adding a customer
+            if not terms:
+                page = self._ids[offset:offset + limit + 1]
+                return page[:limit], len(page) > limit
+
+            # Every term's matches are one contiguous range of the sorted keys; the smallest range is the
+            # most selective term, so only that range is scanned and the other terms filter it
+            ranges = sorted(((self._prefix_range(term), term) for term in set(terms)), key=lambda item: item[0][1] - item[0][0])
+            (start, end), _ = ranges[0]
+            if start == end:
+                return [], False # Some term matches no customer at all
+            filters = [] # Sets of user_ids matching one of the other terms
+            others = [] # Terms matching too many keys for a set; checked per candidate instead
+            for (term_start, term_end), term in ranges[1:]:
+                if term_end - term_start <= self.MAX_FILTER_KEYS:
+                    filters.append(set(map(itemgetter(1), self._keys[term_start:term_end])))
+                else:
+                    others.append(term)
+
+            candidates = map(itemgetter(1), map(self._keys.__getitem__, range(start, end))) # user_ids in key order, lazily
+            for ids in filters:
+                candidates = filter(ids.__contains__, candidates)
+            if others:
+                candidates = self._filter_large(candidates, others)
+
+            needed = offset + limit + 1 # One extra match tells us whether there is a next page
+            matches = []
+            seen = set()
+            for user_id in candidates:
+                if user_id in seen:
+                    continue
+                seen.add(user_id)
+                matches.append(user_id)
+                if len(matches) == needed:
+                    break
+            return matches[offset:offset + limit], len(matches) == needed
+
+    def _prefix_range(self, prefix):
+        # Positions [start, end) of the keys that start with `prefix`
+        start = bisect_left(self._keys, (prefix,))
+        end = bisect_left(self._keys, (prefix[:-1] + chr(ord(prefix[-1]) + 1),), start) # First key past the prefix
+        return start, end
+
+    def _filter_large(self, candidates, terms):
+        # Candidates that also match every term in `terms`, whose ranges were too large for a set up front.
+        # Checking each candidate is cheapest when most of them match; after MAX_CANDIDATE_CHECKS the
+        # matches are evidently sparse, so the rest are intersected with the user_ids of each term's range
+        for checked, user_id in enumerate(candidates, 1):
+            if self._matches_all(user_id, terms):
+                yield user_id
+            if checked == self.MAX_CANDIDATE_CHECKS:
+                break
+        else:
+            return # All candidates were checked
+        for term in terms:
+            start, end = self._prefix_range(term)
+            candidates = filter(set(map(itemgetter(1), self._keys[start:end])).__contains__, candidates)
+        yield from candidates
+
+    def _matches_all(self, user_id, terms):
+        keys = [key for key, _ in self._keys_for(user_id, *self.records[user_id])]
+        return all(any(key.startswith(term) for key in keys) for term in terms)
+
+    def page(self, query="", page=1, page_size=20):
+        """
+        Return one page of the customer directory as a list of dicts, plus a flag for a next page.
+        """
+        with self._lock: # The customers must not change between the search and reading their records
+            user_ids, has_more = self.search(query, offset=(page - 1) * page_size, limit=page_size)
+            rows = [
+                {"Customer ID": user_id, "Name": name, "Email": email, "Phone": phone}
+                for user_id in user_ids
+                for name, email, phone in [self.records[user_id]]
+            ]
+        return rows, has_more
+
+    def __len__(self):
+        return len(self.records)
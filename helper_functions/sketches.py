@@ -0,0 +1,348 @@
+import csv
+import math
+import operator
+import threading
+from array import array
+from datetime import datetime
+from hashlib import blake2b
+
+# Mergeable probabilistic sketches for approximate analytics over long, multi-shop order histories
+
+def _hash64(item, seed=b""):
+    # Stable 64-bit hash; Python's hash() is randomized per process and cannot be merged across runs
+    return int.from_bytes(blake2b(str(item).encode("utf-8"), digest_size=8, key=seed).digest(), "big")
+
+
+## Distinct counts
+class HyperLogLog:
+    """
+    Estimates the number of distinct items using 2**precision one-byte registers.
+    The relative standard error is 1.04 / sqrt(2**precision) (about 1.6% at the default precision).
+    """
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.m = 1 << precision # Number of registers
+        self.registers = bytearray(self.m)
+
+    def add(self, item):
+        h = _hash64(item)
+        index = h >> (64 - self.precision) # First bits pick the register
+        rest = (h << self.precision) & ((1 << 64) - 1) # Remaining bits
+        rank = 64 - rest.bit_length() + 1 if rest else 64 - self.precision + 1 # Position of the first 1-bit
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            return self.m * math.log(self.m / zeros) # Linear counting is more accurate for small sets
+        return estimate
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.m) # One standard deviation
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision.")
+        self.registers = bytearray(map(max, self.registers, other.registers)) # Register-wise maximum
+        return self
+
+
+## Frequencies
+class CountMinSketch:
+    """
+    Approximate item counts in a depth x width table of counters.
+    Estimates never undercount and overcount by at most e / width * total with probability 1 - e**-depth.
+    The table is one flat array of 64-bit counters, allocated on the first add or merge, so the many
+    sketches that never see an item (e.g. months seeded from the CSV) cost no table memory.
+    """
+    def __init__(self, width=2048, depth=5):
+        self.width = width
+        self.depth = depth
+        self.table = None # Flat depth x width array("q"), row-major; None until something is counted
+        self.total = 0 # Sum of all counts added
+
+    def _columns(self, item):
+        h = _hash64(item)
+        h1, h2 = h & 0xFFFFFFFF, h >> 32 # Two hashes combined into `depth` hash functions
+        return [i * self.width + (h1 + i * h2) % self.width for i in range(self.depth)] # Positions in the flat table
+
+    def add(self, item, count=1):
+        if self.table is None:
+            self.table = array("q", bytes(8 * self.width * self.depth)) # All zeros
+        for position in self._columns(item):
+            self.table[position] += count
+        self.total += count
+
+    def estimate(self, item):
+        if self.table is None:
+            return 0
+        return min(self.table[position] for position in self._columns(item))
+
+    def error_bound(self):
+        return math.e / self.width * self.total # Maximum overcount (with probability 1 - e**-depth)
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge Count-Min sketches with different dimensions.")
+        if other.table is None:
+            return self # Nothing to add; common for months without sandwich details
+        if self.table is None:
+            self.table = array("q", other.table) # Copy
+        else:
+            self.table = array("q", map(operator.add, self.table, other.table)) # Cell-wise sum
+        self.total += other.total
+        return self
+
+
+class HeavyHitters:
+    """
+    Tracks the most frequent items: a Count-Min sketch for the counts plus a bounded set of candidates.
+    """
+    def __init__(self, capacity=50, width=2048, depth=5):
+        self.capacity = capacity # Maximum number of candidate items kept
+        self.counts = CountMinSketch(width, depth)
+        self.candidates = {} # item -> estimated count
+
+    def add(self, item, count=1):
+        self.counts.add(item, count)
+        estimate = self.counts.estimate(item)
+        if item in self.candidates or len(self.candidates) < self.capacity:
+            self.candidates[item] = estimate
+            return
+        weakest = min(self.candidates, key=self.candidates.get)
+        if estimate > self.candidates[weakest]:
+            del self.candidates[weakest] # Make room for the more frequent item
+            self.candidates[item] = estimate
+
+    def top(self, n=10):
+        """
+        Return [(item, estimated count)] for the n most frequent items.
+        """
+        return sorted(self.candidates.items(), key=lambda pair: pair[1], reverse=True)[:n]
+
+    def error_bound(self):
+        return self.counts.error_bound()
+
+    def merge(self, other):
+        self.counts.merge(other.counts)
+        items = set(self.candidates) | set(other.candidates)
+        estimates = {item: self.counts.estimate(item) for item in items} # Re-estimate on the merged counts
+        self.candidates = dict(sorted(estimates.items(), key=lambda pair: pair[1], reverse=True)[:self.capacity])
+        return self
+
+
+## Distributions
+class TDigest:
+    """
+    Approximates a distribution with a bounded number of weighted centroids.
+    Centroids are small near the tails, so extreme quantiles (p99) stay accurate.
+    Every centroid also keeps the smallest and largest value merged into it, which gives guaranteed
+    bounds for each quantile.
+    """
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = [] # Sorted list of [mean, weight, smallest value, largest value]
+        self._buffer = [] # Values added since the last compression
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, weight=1):
+        value = float(value)
+        self._buffer.append([value, weight, value, value])
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        merged = [points[0]]
+        cumulative = 0 # Weight of the centroids before the current one
+        for mean, weight, low, high in points[1:]:
+            current = merged[-1]
+            q = (cumulative + current[1] + weight / 2) / self.count # Quantile of the merged centroid
+            limit = max(1, 4 * self.count * q * (1 - q) / self.compression) # Smaller centroids near the tails
+            if current[1] + weight <= limit:
+                current[0] = (current[0] * current[1] + mean * weight) / (current[1] + weight)
+                current[1] += weight
+                current[2] = min(current[2], low)
+                current[3] = max(current[3], high)
+            else:
+                cumulative += current[1]
+                merged.append([mean, weight, low, high])
+        self.centroids = merged
+
+    def quantile(self, q):
+        """
+        Estimate the value at quantile q (0..1). The estimate always lies within quantile_bounds(q).
+        """
+        self._compress()
+        if not self.centroids:
+            return None
+        low, high = self.quantile_bounds(q)
+        return min(max(self._interpolate(q), low), high)
+
+    def _interpolate(self, q):
+        target = q * self.count
+        cumulative = 0
+        previous_mean, previous_center = self.min, 0
+        for mean, weight, _, _ in self.centroids:
+            center = cumulative + weight / 2 # Rank of the centroid's middle
+            if target <= center:
+                if center == previous_center:
+                    return mean
+                fraction = (target - previous_center) / (center - previous_center)
+                return previous_mean + fraction * (mean - previous_mean) # Interpolate between centroids
+            previous_mean, previous_center = mean, center
+            cumulative += weight
+        return self.max
+
+    def quantile_bounds(self, q):
+        """
+        Return (low, high): a range that is guaranteed to contain the exact q-quantile, whichever
+        interpolation between neighbouring values it uses. Tight in the tails, wider around the median.
+        """
+        self._compress()
+        if not self.centroids:
+            return None, None
+        # 1-based ranks of the two values an exact quantile interpolates between
+        low_rank = math.floor(q * (self.count - 1)) + 1
+        high_rank = math.ceil(q * (self.count - 1)) + 1
+        # At least `low_rank` values are <= the value at that rank, and only centroids whose smallest value is
+        # at or below it can hold them; symmetrically, all values of a centroid are <= its largest value
+        return self._rank_bound(low_rank, 2), self._rank_bound(high_rank, 3)
+
+    def _rank_bound(self, rank, field):
+        # Walk the centroids by their smallest (field 2) or largest (field 3) value until `rank` values are covered
+        cumulative = 0
+        for centroid in sorted(self.centroids, key=lambda c: c[field]):
+            cumulative += centroid[1]
+            if cumulative >= rank:
+                return centroid[field]
+        return self.max
+
+    def merge(self, other):
+        other._compress()
+        self._buffer.extend(list(centroid) for centroid in other.centroids) # Copies; other keeps its own
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress() # Otherwise compressed lazily on the next query
+        return self
+
+
+## Per-period sketches
+def sandwich_configuration(sandwich):
+    # Canonical text for a sandwich, so identical configurations are counted together
+    return " | ".join([
+        sandwich.bread or "", sandwich.spread or "", sandwich.protein or "",
+        " + ".join(sorted(sandwich.vegetables)), sandwich.dressing or "", " + ".join(sorted(sandwich.extras)),
+    ])
+
+
+class PeriodSketches:
+    """
+    All sketches for one shop and one month. Sketches for several months or shops are combined with merge().
+    """
+    def __init__(self):
+        self.orders = 0 # Exact; a counter is as cheap as a sketch
+        self.customers = HyperLogLog()
+        self.ingredients = HeavyHitters()
+        self.configurations = HeavyHitters()
+        self.order_values = TDigest()
+
+    def record_order(self, customer_id, total, sandwiches=()):
+        self.orders += 1
+        self.customers.add(customer_id)
+        self.order_values.add(total)
+        for sandwich in sandwiches:
+            self.configurations.add(sandwich_configuration(sandwich))
+            for ingredient in sandwich.required_stock(): # (category, ingredient) pairs, "No ..." excluded
+                self.ingredients.add(ingredient[1])
+
+    def merge(self, other):
+        self.orders += other.orders
+        self.customers.merge(other.customers)
+        self.ingredients.merge(other.ingredients)
+        self.configurations.merge(other.configurations)
+        self.order_values.merge(other.order_values)
+        return self
+
+
+class SketchStore:
+    """
+    Sketches keyed by (shop_id, month), updated as orders are placed and merged on demand.
+    Months keep the number of sketches to merge small (12 per shop and year); merged results are
+    cached until the next order is recorded, so repeated queries on an unchanged store are free.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._periods = {} # (shop_id, "YYYY-MM") -> PeriodSketches
+        self._version = 0 # Incremented on every recorded order
+        self._merged_cache = {} # (version, start, end, shop_ids) -> merged PeriodSketches
+
+    def record_order(self, customer_id, order_time, total, sandwiches=(), shop_id="main"):
+        """
+        Add one order to its shop's sketches for the month.
+        """
+        key = (shop_id, order_time.strftime("%Y-%m"))
+        with self._lock:
+            self._periods.setdefault(key, PeriodSketches()).record_order(customer_id, total, sandwiches)
+            self._version += 1
+            self._merged_cache.clear() # Every cached result is now out of date
+
+    def load_csv(self, path, shop_id="main"):
+        """
+        Seed the sketches from an orders CSV ("Customer ID", "Order Time", "Total Cost (DKK)").
+        Historical CSV rows have no sandwich details, so they only feed customers and order values.
+        """
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                order_time = datetime.strptime(row["Order Time"], "%Y-%m-%d %H:%M:%S")
+                self.record_order(row["Customer ID"], order_time, float(row["Total Cost (DKK)"]), shop_id=shop_id)
+
+    def record_orders(self, orders):
+        """
+        Add Order objects, e.g. the orders recovered from the event log.
+        """
+        for order in orders:
+            total = order.calculate_total()[0]
+            self.record_order(order.customer.user_id, order.order_time, total, order.sandwiches, order.shop_id)
+
+    def months(self, shop_ids=None):
+        """
+        Return the months ("YYYY-MM") with recorded orders for the given shops, oldest first.
+        """
+        with self._lock:
+            return sorted({month for shop_id, month in self._periods if shop_ids is None or shop_id in shop_ids})
+
+    def merged(self, start=None, end=None, shop_ids=None):
+        """
+        Merge the sketches of every month between start and end (inclusive, "YYYY-MM") for the given shops.
+        The result is shared with other callers until the next order is recorded and must not be modified.
+        """
+        shop_ids = frozenset(shop_ids) if shop_ids is not None else None
+        with self._lock:
+            cache_key = (self._version, start, end, shop_ids)
+            result = self._merged_cache.get(cache_key)
+            if result is not None:
+                return result
+            result = PeriodSketches()
+            for (shop_id, month), sketches in self._periods.items():
+                if shop_ids is not None and shop_id not in shop_ids:
+                    continue
+                if (start and month < start) or (end and month > end):
+                    continue
+                result.merge(sketches)
+            result.order_values._compress() # Queries on the shared result then never modify it
+            self._merged_cache[cache_key] = result
+        return result
@@ -1,53 +1,139 @@
-import pandas as pd
+import threading
+
 import streamlit as st
 
 # Helper functions to update dataframes
+# pandas is imported inside the functions so the Customer View never pays for it
+# The dataframes are shared by every session, so analytics include the orders placed in any session
+
+DATA_FILES = {
+    "ingredients_df": "simulated_data/ingredients.csv",
+    "customers_df": "simulated_data/customers.csv",
+    "orders_df": "simulated_data/orders.csv",
+}
+
+@st.cache_resource
+def get_datasets():
+    # The loaded dataframes (keys of DATA_FILES) and their versions, one set per process
+    return {
+        "lock": threading.RLock(), # Held while a dataframe or version is replaced
+        "data_version": 0, # Incremented whenever customers_df or orders_df change
+        "shop_versions": {}, # shop_id -> counter of that shop's order changes ("*" means every shop)
+    }
+
+
+def bump_data_version(shop_id=None):
+    # Increment the data version so background analytics know the dataframes changed
+    datasets = get_datasets()
+    with datasets["lock"]:
+        datasets["data_version"] += 1
+        if shop_id:
+            # Per-shop order versions let analytics recompute only the shop that changed
+            shop_versions = datasets["shop_versions"]
+            shop_versions[shop_id] = shop_versions.get(shop_id, 0) + 1
+
+
+def load_dataframes(customers, orders):
+    # Load the datasets the first time any session needs them; returns the shared datasets
+    datasets = get_datasets()
+    with datasets["lock"]:
+        if all(key in datasets for key in DATA_FILES):
+            return datasets
+        import pandas as pd
+        for key, path in DATA_FILES.items():
+            if key not in datasets:
+                datasets[key] = pd.read_csv(path)
+        if "Shop ID" not in datasets["orders_df"].columns:
+            datasets["orders_df"]["Shop ID"] = "main" # The historical data comes from the original shop
+        historical = datasets["customers_df"]
+        datasets["historical_purchases"] = dict(zip(
+            historical["Customer ID"], zip(historical["Total Sandwiches Purchased"], historical["Number of Orders"])
+        )) # Preloaded customers who log in keep the purchases made before their account existed
+
+        # Merge in the customers and orders created or recovered before the datasets were loaded
+        if customers:
+            update_customers_df(customers)
+        if orders:
+            update_orders_df(orders)
+    return datasets
+
+
+def analytics_snapshot():
+    # The data version, orders_df, customers_df, ingredients_df and shop versions, read together
+    datasets = get_datasets()
+    with datasets["lock"]:
+        return (
+            datasets["data_version"],
+            datasets["orders_df"],
+            datasets["customers_df"],
+            datasets["ingredients_df"],
+            dict(datasets["shop_versions"]),
+        )
+
+
+def update_customers_df(customers):
+    datasets = get_datasets()
+    with datasets["lock"]: # Rebuilt under the lock so an older snapshot never replaces a newer one
+        if "customers_df" not in datasets:
+            bump_data_version()
+            return # Not loaded yet; load_dataframes() will include the customers
+        import pandas as pd
+
+        # Extract data from the customers; other sessions may add customers meanwhile, so iterate over a copy
+        new_data = []
+        for customer in list(customers.values()):
+            past_sandwiches, past_orders = datasets["historical_purchases"].get(customer.user_id, (0, 0))
+            new_data.append({
+                "Customer ID": customer.user_id,
+                "Name": customer.name,
+                "Email": customer.email,
+                "Phone": customer.phone,
+                "Total Sandwiches Purchased": past_sandwiches + customer.sandwich_count,
+                "Number of Orders": past_orders + len(customer.order_history)
+            })
+
+        # Convert to DataFrame
+        new_customers_df = pd.DataFrame(new_data)
+
+        # Merge with existing customers_df to retain preloaded data; the dataframe is replaced, never modified in place
+        if not datasets["customers_df"].empty:
+            datasets["customers_df"] = pd.concat(
+                [datasets["customers_df"], new_customers_df]
+            ).drop_duplicates(subset=["Customer ID"], keep="last").reset_index(drop=True)
+        else:
+            datasets["customers_df"] = new_customers_df
+        bump_data_version()
+
+
+def update_orders_df(orders, shop_id="*"):
+    datasets = get_datasets()
+    with datasets["lock"]: # Rebuilt under the lock so an older snapshot never replaces a newer one
+        if "orders_df" not in datasets:
+            bump_data_version(shop_id)
+            return # Not loaded yet; load_dataframes() will include the orders
+        import pandas as pd
+
+        # Extract data from the orders of every session
+        new_data = []
+        for order in list(orders):
+            new_data.append({
+                "Order ID": order.order_id,
+                "Shop ID": order.shop_id,
+                "Customer ID": order.customer.user_id,
+                "Order Time": order.order_time.strftime("%Y-%m-%d %H:%M:%S"),
+                "Total Cost (DKK)": order.calculate_total()[0],
+                "Number of Sandwiches": len(order.sandwiches),
+                "Status": order.status
+            })
+
+        # Convert to DataFrame
+        new_orders_df = pd.DataFrame(new_data)
 
-def update_customers_df():
-    # Extract data from current session state customers
-    new_data = []
-    for customer_id, customer in st.session_state.customers.items():
-        new_data.append({
-            "Customer ID": customer.user_id,
-            "Name": customer.name,
-            "Email": customer.email,
-            "Phone": customer.phone,
-            "Total Sandwiches Purchased": customer.sandwich_count,
-            "Number of Orders": len(customer.order_history)
-        })
-
-    # Convert to DataFrame
-    new_customers_df = pd.DataFrame(new_data)
-
-    # Merge with existing customers_df to retain preloaded data
-    if "customers_df" in st.session_state and not st.session_state.customers_df.empty:
-        st.session_state.customers_df = pd.concat(
-            [st.session_state.customers_df, new_customers_df]
-        ).drop_duplicates(subset=["Customer ID"], keep="last").reset_index(drop=True)
-    else:
-        st.session_state.customers_df = new_customers_df
-
-
-def update_orders_df():
-    # Extract data from current session state orders
-    new_data = []
-    for order in st.session_state.orders:
-        new_data.append({
-            "Order ID": order.order_id,
-            "Customer ID": order.customer.user_id,
-            "Order Time": order.order_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "Total Cost (DKK)": order.calculate_total()[0],
-            "Number of Sandwiches": len(order.sandwiches),
-            "Status": order.status
-        })
-
-    # Convert to DataFrame
-    new_orders_df = pd.DataFrame(new_data)
-
-    # Merge with existing orders_df to retain preloaded data
-    if "orders_df" in st.session_state and not st.session_state.orders_df.empty:
-        st.session_state.orders_df = pd.concat(
-            [st.session_state.orders_df, new_orders_df]
-        ).drop_duplicates(subset=["Order ID"], keep="last").reset_index(drop=True)
-    else:
-        st.session_state.orders_df = new_orders_df
\ No newline at end of file
+        # Merge with existing orders_df to retain preloaded data; the dataframe is replaced, never modified in place
+        if not datasets["orders_df"].empty:
+            datasets["orders_df"] = pd.concat(
+                [datasets["orders_df"], new_orders_df]
+            ).drop_duplicates(subset=["Order ID"], keep="last").reset_index(drop=True)
+        else:
+            datasets["orders_df"] = new_orders_df
+        bump_data_version(shop_id)